@@ -0,0 +1,76 @@
+# Non-blocking autostart.
+#
+# The startup_once hook runs inside qtile's event loop, so anything it waits
+# on freezes the window manager.  Services are declared in config.py with the
+# names of the services they need to come after; everything whose
+# dependencies are satisfied is started at once as an asyncio subprocess,
+# and the hook returns immediately.  Per-service timings and the total time
+# until the last one is up are logged.
+
+import asyncio
+import time
+
+from libqtile.log_utils import logger
+
+# Roughly when qtile started: this module is imported while the config loads.
+loaded = time.monotonic()
+
+
+class Service:
+    """A program to start once per session.
+
+    after: names of services that must be up (or, if they wait, finished)
+        before this one starts.
+    wait: wait for the command to exit before counting it as up, for one-shot
+        setup commands like xrandr; daemons count as up once spawned.
+    """
+
+    def __init__(self, name, cmd, after=(), wait=False):
+        self.name = name
+        self.cmd = cmd
+        self.after = list(after)
+        self.wait = wait
+
+
+def ms(start):
+    return (time.monotonic() - start) * 1000
+
+
+async def launch(service, deps, begin):
+    await asyncio.gather(*deps)
+    started = time.monotonic()
+    proc = await asyncio.create_subprocess_shell(
+        service.cmd, stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL, start_new_session=True)
+    if service.wait:
+        code = await proc.wait()
+        if code != 0:
+            logger.warning("autostart: %s exited with %d", service.name, code)
+    logger.info("autostart: %s up at +%.0fms (took %.0fms)",
+                service.name, ms(begin), ms(started))
+
+
+async def run(services):
+    begin = time.monotonic()
+    tasks = {}
+    for service in services:
+        missing = [name for name in service.after if name not in tasks]
+        if missing:
+            # Dependencies have to be declared first, which also rules out cycles.
+            logger.error("autostart: skipping %s, unknown or later dependencies %s",
+                         service.name, ", ".join(missing))
+            continue
+        deps = [tasks[name] for name in service.after]
+        tasks[service.name] = asyncio.ensure_future(launch(service, deps, begin))
+
+    results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+    for name, result in zip(tasks, results):
+        if isinstance(result, Exception):
+            logger.error("autostart: %s failed: %s", name, result)
+    logger.info("autostart: desktop usable %.0fms after config load (autostart took %.0fms)",
+                ms(loaded), ms(begin))
+
+
+def start(services):
+    """Kicks off run() on the running loop without waiting for it."""
+    return asyncio.ensure_future(run(services))
@@ -0,0 +1,147 @@
+# Batched command chains.
+#
+# A Key with several commands runs each one through qtile's command server
+# on its own: the target is looked up again every time, and every layout
+# command lays the group out (and repaints its windows) straight away, only
+# for the next command to do it again.  chain() runs a binding's commands as
+# one batch instead: each target is resolved once, group.layout_all() is
+# held back while the commands run, and every group that asked for a layout
+# gets exactly one pass at the end.
+#
+#   Key([mod], "equal", batch.chain(lazy.layout.grow(), lazy.layout.increase_nmaster()))
+#
+# Scripts can send a batch over the command IPC in one round trip, through
+# eval on the root object (where `self` is qtile):
+#
+#   qtile cmd-obj -o cmd -f eval -a "__import__('batch').execute(self, \
+#       \"layout.grow(); layout.increase_nmaster(); group['DEV'].toscreen()\")"
+
+import ast
+import contextlib
+
+from libqtile.command.base import SelectError
+from libqtile.lazy import lazy
+from libqtile.log_utils import logger
+
+stats = {"batches": 0, "commands": 0, "passes_requested": 0, "passes_run": 0}
+
+
+def saved_passes():
+    return stats["passes_requested"] - stats["passes_run"]
+
+
+class Command:
+    """A parsed IPC command, shaped like the LazyCalls run() is given."""
+
+    def __init__(self, selectors, name, args=(), kwargs=None):
+        self.selectors = selectors
+        self.name = name
+        self.args = tuple(args)
+        self.kwargs = kwargs or {}
+
+    def check(self, qtile):
+        return True
+
+
+@contextlib.contextmanager
+def deferred_layout(qtile):
+    """Holds back layout_all() on every group, then runs it once per group."""
+    requested = {}
+
+    def hold(group):
+        def layout_all(warp=False):
+            stats["passes_requested"] += 1
+            requested[group] = requested.get(group, False) or warp
+        return layout_all
+
+    groups = list(qtile.groups)
+    for group in groups:
+        group.layout_all = hold(group)
+    try:
+        yield
+    finally:
+        for group in groups:
+            del group.layout_all
+        for group, warp in requested.items():
+            stats["passes_run"] += 1
+            group.layout_all(warp)
+
+
+def run(qtile, calls):
+    """Runs calls (LazyCalls or Commands) as one batch."""
+    stats["batches"] += 1
+    targets = {}
+    with deferred_layout(qtile):
+        for call in calls:
+            if not call.check(qtile):
+                continue
+            selectors = tuple(tuple(s) for s in call.selectors)
+            if selectors not in targets:
+                try:
+                    targets[selectors] = qtile.select(list(selectors))
+                except SelectError:
+                    targets[selectors] = None
+            target = targets[selectors]
+            command = target.command(call.name) if target is not None else None
+            if command is None:
+                logger.error("batch: no command %s on %s", call.name, selectors or "root")
+                continue
+            stats["commands"] += 1
+            try:
+                command(*call.args, **call.kwargs)
+            except Exception:
+                logger.exception("batch: %s failed", call.name)
+
+
+def chain(*calls):
+    """A single binding action running calls as one batch."""
+    return lazy.function(run, calls)
+
+
+def calls(command):
+    """The calls a binding's command stands for: a chain's, or just itself."""
+    if getattr(command, "name", None) == "function" and command.args[:1] == (run,):
+        return list(command.args[1])
+    return [command]
+
+
+def selector_path(node):
+    """Turns layout / group['DEV'] / screen[0] attribute chains into selectors."""
+    if isinstance(node, ast.Name):
+        return [(node.id, None)]
+    if isinstance(node, ast.Attribute):
+        return selector_path(node.value) + [(node.attr, None)]
+    if isinstance(node, ast.Subscript):
+        path = selector_path(node.value)
+        index = node.slice
+        if isinstance(index, getattr(ast, "Index", ())):  # Python < 3.9
+            index = index.value
+        path[-1] = (path[-1][0], ast.literal_eval(index))
+        return path
+    raise ValueError("can't select {}".format(ast.dump(node)))
+
+
+def parse(script):
+    """Parses "layout.grow(); group['DEV'].toscreen(); spawn('alacritty')"."""
+    commands = []
+    for statement in ast.parse(script.strip()).body:
+        call = statement.value if isinstance(statement, ast.Expr) else None
+        if not isinstance(call, ast.Call):
+            raise ValueError("not a command call: {}".format(ast.dump(statement)))
+        if isinstance(call.func, ast.Name):
+            selectors, name = [], call.func.id
+        elif isinstance(call.func, ast.Attribute):
+            selectors, name = selector_path(call.func.value), call.func.attr
+        else:
+            raise ValueError("not a command call: {}".format(ast.dump(call)))
+        args = [ast.literal_eval(arg) for arg in call.args]
+        kwargs = {kw.arg: ast.literal_eval(kw.value) for kw in call.keywords}
+        commands.append(Command(selectors, name, args, kwargs))
+    return commands
+
+
+def execute(qtile, script):
+    """Parses and runs script as one batch; returns the layout passes it saved."""
+    before = saved_passes()
+    run(qtile, parse(script))
+    return saved_passes() - before
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+# Microbenchmarks for the helpers that live next to config.py.
+#
+# They run against small in-memory stand-ins for qtile's objects, so no X
+# server is needed, only an importable libqtile.
+#
+#   python3 bench.py            # run everything
+#   python3 bench.py nav        # just the group/screen navigation
+#   python3 bench.py focus      # replay a pointer trace through focus.py
+#   python3 bench.py layouts    # config.py's layouts with 5/50/500 windows
+#
+# The exit status is 1 if a benchmark with regression thresholds (layouts)
+# went over any of them.
+
+import argparse
+import functools
+import heapq
+import json
+import os
+import random
+import sys
+import time
+import timeit
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+
+def report(name, seconds, calls):
+    print("  {:<40} {:>10.2f} us/call".format(name, seconds / calls * 1e6))
+
+
+##### NAVIGATION #####
+
+class FakeGroup:
+    def __init__(self, name):
+        self.name = name
+        self.label = name
+
+
+class FakeWindow:
+    def __init__(self, qtile):
+        self.qtile = qtile
+
+    def togroup(self, name, switch_group=False):
+        if switch_group:
+            self.qtile.current_group = self.qtile.groups_map[name]
+
+
+class FakeQtile:
+    def __init__(self, ngroups):
+        self.groups = [FakeGroup("g{}".format(i)) for i in range(ngroups)]
+        self.groups_map = {g.name: g for g in self.groups}
+        self.current_group = self.groups[-1]
+        self.current_window = FakeWindow(self)
+
+
+def list_scan_to_next_group(qtile):
+    # What config.py used to do on every keypress.
+    i = qtile.groups.index(qtile.current_group)
+    qtile.current_window.togroup(qtile.groups[(i + 1) % len(qtile.groups)].name,
+                                 switch_group=True)
+
+
+def bench_nav(calls=20000):
+    import nav
+    print("window_to_group(+1, follow) with the focused group last in the list")
+    for ngroups in (9, 90, 900, 9000):
+        qtile = FakeQtile(ngroups)
+        nav.invalidate()
+        nav.group_names(qtile)
+
+        def indexed():
+            qtile.current_group = qtile.groups[-1]
+            nav.window_to_group(qtile, 1, True)
+
+        def scanned():
+            qtile.current_group = qtile.groups[-1]
+            list_scan_to_next_group(qtile)
+
+        report("{} groups, index map".format(ngroups), timeit.timeit(indexed, number=calls), calls)
+        report("{} groups, list scan".format(ngroups), timeit.timeit(scanned, number=calls), calls)
+
+
+##### FOCUS #####
+
+# Each focus change recolours the old and new window's borders and redraws
+# the WindowName widget.
+REDRAWS_PER_FOCUS = 3
+
+
+class FakeLoop:
+    """Just enough of qtile.call_later, on a clock the replay moves by hand."""
+
+    class Handle:
+        def __init__(self):
+            self.cancelled = False
+
+        def cancel(self):
+            self.cancelled = True
+
+    def __init__(self):
+        self.now = 0
+        self.timers = []
+        self.serial = 0
+
+    def call_later(self, delay, func, *args):
+        handle = self.Handle()
+        self.serial += 1
+        heapq.heappush(self.timers, (self.now + delay, self.serial, handle, func, args))
+        return handle
+
+    def advance(self, until):
+        while self.timers and self.timers[0][0] <= until:
+            when, _, handle, func, args = heapq.heappop(self.timers)
+            self.now = when
+            if not handle.cancelled:
+                func(*args)
+        self.now = until
+
+
+class FakeFocusGroup:
+    def __init__(self, qtile):
+        self.qtile = qtile
+        self.current_window = None
+        self.screen = None
+        self.changes = 0
+
+    def focus(self, client, warp=True):
+        self.current_window = self.qtile.current_window = client
+        self.changes += 1
+
+
+class FakeClient:
+    def __init__(self, wid, group):
+        self.wid = wid
+        self.group = group
+
+
+def synthetic_trace(windows=6, sweeps=500, seed=1):
+    """Pointer sweeps across a few windows (10-40ms in each) before settling."""
+    rng = random.Random(seed)
+    t, trace = 0.0, []
+    for _ in range(sweeps):
+        for _ in range(rng.randint(1, 4)):
+            trace.append((t, rng.randrange(windows)))
+            t += rng.uniform(0.01, 0.04)
+        trace.append((t, rng.randrange(windows)))
+        t += rng.uniform(0.5, 3)
+    return trace
+
+
+def replay_focus(trace, dwell):
+    import focus
+    # The loop doubles as the qtile object: call_later and current_window.
+    loop = FakeLoop()
+    loop.current_window = None
+    group = FakeFocusGroup(loop)
+    clients = {}
+    debounce = focus.FocusDebounce(dwell=dwell)
+    debounce.qtile = loop
+    start = trace[0][0]
+    for t, wid in trace:
+        loop.advance(t - start)
+        client = clients.setdefault(wid, FakeClient(wid, group))
+        debounce.on_enter(client)
+    loop.advance(float("inf"))
+    return group.changes
+
+
+def bench_focus():
+    import focus
+    if os.path.exists(focus.TRACE_FILE):
+        with open(focus.TRACE_FILE) as f:
+            trace = [tuple(event) for event in json.load(f)]
+        print("replaying {} pointer crossings from {}".format(len(trace), focus.TRACE_FILE))
+    else:
+        trace = synthetic_trace()
+        print("replaying {} synthetic pointer crossings".format(len(trace)))
+    if not trace:
+        return
+    # follow_mouse_focus = True focuses every window entered that isn't focused.
+    immediate, current = 0, None
+    for _, wid in trace:
+        if wid != current:
+            immediate += 1
+            current = wid
+    print("  {:<40} {:>6} focus changes {:>6} redraws".format(
+        "follow_mouse_focus", immediate, immediate * REDRAWS_PER_FOCUS))
+    for dwell in (0.03, 0.05, 0.08, 0.15):
+        changes = replay_focus(trace, dwell)
+        print("  {:<40} {:>6} focus changes {:>6} redraws avoided".format(
+            "debounced, {:.0f}ms dwell".format(dwell * 1000), changes,
+            (immediate - changes) * REDRAWS_PER_FOCUS))
+
+
+##### LAYOUTS #####
+
+LAYOUT_SIZES = (5, 50, 500)
+LAYOUT_SCREEN = (0, 20, 2560, 1420)  # 1440p below a 20px bar
+
+# Key bindings that call these layout commands are replayed, grouped by what
+# they do.  Commands a layout doesn't have are skipped for it.
+KEY_OPS = {
+    "navigate": ("up", "down", "left", "right", "next", "section_up", "section_down"),
+    "shuffle": ("shuffle_up", "shuffle_down", "shuffle_left", "shuffle_right",
+                "client_to_next", "rotate", "flip"),
+    "resize": ("grow", "shrink", "normalize", "maximize", "increase_nmaster",
+               "decrease_nmaster", "toggle_split"),
+}
+KEY_ROUNDS = 5
+
+# Every operation is one keypress or window event and should cost at most one
+# layout pass, which configures each window at most once.  Time and memory
+# limits are loose enough for any machine; they catch accidental blowups.
+THRESHOLDS = {
+    "passes_per_op": 1,
+    "configures_per_window": 1,
+    "us_per_configure": 50,
+    "kb_per_op": 64,
+}
+
+
+class LayoutScreen:
+    def get_rect(self):
+        from libqtile.config import ScreenRect
+        return ScreenRect(*LAYOUT_SCREEN)
+
+
+class LayoutGroup:
+    """The parts of libqtile.group._Group that layouts call back into."""
+
+    def __init__(self, template):
+        self.name = "bench"
+        self.screen = LayoutScreen()
+        self.windows = []
+        self.current_window = None
+        self.layout = template.clone(self)
+        self.layouts = [self.layout]
+        self.passes = 0
+        self.configures = 0
+
+    def layout_all(self, warp=False):
+        self.passes += 1
+        if self.windows:
+            self.layout.layout(self.windows, self.screen.get_rect())
+
+    def focus(self, win, warp=True, force=False):
+        self.current_window = win
+        if win is not None:
+            self.layout.focus(win)
+        self.layout_all(warp)
+
+    def add(self, win):
+        self.windows.append(win)
+        self.layout.add(win)
+        self.focus(win)
+
+    def remove(self, win):
+        self.windows.remove(win)
+        following = self.layout.remove(win)
+        if following is None and self.windows:
+            following = self.layout.focus_first()
+        self.focus(following)
+
+
+class LayoutClient:
+    """A window as far as layouts are concerned; counts configure requests."""
+
+    def __init__(self, wid, group):
+        self.wid = wid
+        self.name = "window {}".format(wid)
+        self.group = group
+        self.x, self.y, self.width, self.height = 0, 0, 800, 600
+        self.float_x = self.float_y = 0
+        self.floating = self.maximized = self.fullscreen = self.minimized = False
+
+    @property
+    def has_focus(self):
+        return self.group.current_window is self
+
+    def place(self, x, y, width, height, *args, **kwargs):
+        self.group.configures += 1
+        self.x, self.y, self.width, self.height = x, y, width, height
+
+    def hide(self):
+        pass
+
+    def unhide(self):
+        pass
+
+    def paint_borders(self, colour, width):
+        pass
+
+    def cmd_bring_to_front(self):
+        pass
+
+    def get_wm_class(self):
+        return None
+
+    def has_user_set_position(self):
+        return False
+
+    def info(self):
+        return {"name": self.name, "id": self.wid}
+
+
+def configured_layouts():
+    """The layouts list and key bindings of the config.py next to this file."""
+    import batch
+    import reload
+    config = reload.load(os.path.join(HERE, "config.py"))
+    bound = set()
+    for key in config.keys:
+        for command in key.commands:
+            # Chained bindings (batch.chain) count with the calls they run.
+            for call in batch.calls(command):
+                if getattr(call, "selectors", None) == [("layout", None)] and not call.args:
+                    bound.add(call.name)
+    return config.layouts, bound
+
+
+def layout_script(template, windows, bound):
+    """Yields (operation, steps, group) for one scripted session."""
+    group = LayoutGroup(template)
+    clients = [LayoutClient(i, group) for i in range(windows)]
+    yield "add", [functools.partial(group.add, c) for c in clients], group
+    yield "focus", [functools.partial(group.focus, c) for c in reversed(clients)], group
+    for op, names in KEY_OPS.items():
+        commands = [getattr(group.layout, "cmd_" + name) for name in names
+                    if name in bound and hasattr(group.layout, "cmd_" + name)]
+        if commands:
+            yield op, commands * KEY_ROUNDS, group
+    yield "remove", [functools.partial(group.remove, c) for c in clients], group
+
+
+def run_layout(template, windows, bound, trace=False):
+    results = {}
+    for op, steps, group in layout_script(template, windows, bound):
+        passes, configures = group.passes, group.configures
+        live = len(group.windows)
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        for step in steps:
+            step()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace else 0
+        if trace:
+            tracemalloc.stop()
+        results[op] = {
+            "ops": len(steps),
+            "seconds": elapsed,
+            "passes": group.passes - passes,
+            "configures": group.configures - configures,
+            "windows": max(live, len(group.windows)),
+            "peak": peak,
+        }
+    return results
+
+
+def check_layout(results):
+    limits = []
+    for op, r in results.items():
+        if r["passes"] > r["ops"] * THRESHOLDS["passes_per_op"]:
+            limits.append("{}: {} layout passes for {} ops".format(op, r["passes"], r["ops"]))
+        if r["configures"] > r["passes"] * r["windows"] * THRESHOLDS["configures_per_window"]:
+            limits.append("{}: {} configures in {} passes over {} windows".format(
+                op, r["configures"], r["passes"], r["windows"]))
+        if r["configures"] and r["seconds"] / r["configures"] * 1e6 > THRESHOLDS["us_per_configure"]:
+            limits.append("{}: {:.1f}us per configure".format(
+                op, r["seconds"] / r["configures"] * 1e6))
+        if r["peak"] / r["ops"] / 1024 > THRESHOLDS["kb_per_op"]:
+            limits.append("{}: {:.1f}KB allocated per op".format(op, r["peak"] / r["ops"] / 1024))
+    return limits
+
+
+def bench_layouts():
+    layouts, bound = configured_layouts()
+    failures = []
+    for template in layouts:
+        print("{} ({})".format(template.name, type(template).__name__))
+        for windows in LAYOUT_SIZES:
+            timed = run_layout(template, windows, bound)
+            traced = run_layout(template, windows, bound, trace=True)
+            for op, r in timed.items():
+                r["peak"] = traced[op]["peak"]
+                print("  {:>3} windows  {:<10} {:>10.2f} us/op {:>8.1f} KB/op {:>8.1f} configures/op".format(
+                    windows, op, r["seconds"] / r["ops"] * 1e6, r["peak"] / r["ops"] / 1024,
+                    r["configures"] / r["ops"]))
+            for limit in check_layout(timed):
+                line = "{} with {} windows, {}".format(template.name, windows, limit)
+                print("  REGRESSION " + line)
+                failures.append(line)
+    return failures
+
+
+BENCHMARKS = {
+    "nav": bench_nav,
+    "focus": bench_focus,
+    "layouts": bench_layouts,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the qtile config helpers.")
+    parser.add_argument("names", nargs="*", metavar="name",
+                        help="benchmarks to run: {} (default: all)".format(", ".join(BENCHMARKS)))
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error("unknown benchmark: {}".format(", ".join(unknown)))
+    failures = []
+    for name in args.names or BENCHMARKS:
+        print("== {} ==".format(name))
+        failures += BENCHMARKS[name]() or []
+    if failures:
+        print("{} regression threshold(s) exceeded".format(len(failures)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
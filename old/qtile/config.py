@@ -1,17 +1,38 @@
+import startup                                   # First, so the startup profile covers the imports
+startup.mark("imports")
+
 import os
-import re
-import socket
-import subprocess
 from libqtile import qtile
-from libqtile.config import KeyChord, Key, Screen, Group, Drag, Click, Match
-from libqtile.command import lazy
-from libqtile import layout, bar, widget, hook, extension
+from libqtile.config import Key, Screen, Group, Drag, Click, Match, ScratchPad
+from libqtile import layout, bar, widget, hook  # widget imports each widget's module on first use
 from libqtile.lazy import lazy
-from typing import List  # noqa: F401
+import autostart
+import batch
+import drag
+import focus
+import grouplayouts
+import keymap
+import launcher
+import nav
+import reload
+import rules
+import sources
+import switcher
+import widgets
 
+startup.mark("keys")
 mod = "mod4"                                     # Sets mod key to SUPER/WINDOWS
 myTerm = "alacritty"                             # My terminal of choice
 myConfig = "/home/mike/.config/qtile/config.py"    # The Qtile config file location
+term_pool_size = 0                               # Warm terminals kept for SUPER+ALT apps (0 = off)
+
+term_pool = launcher.TermPool(myTerm, size=term_pool_size)
+
+# Window list for the switcher (mod1+control+p), kept up to date from hooks.
+window_switcher = switcher.Switcher("dmenu -i -l 80 -p Window: -fn 'Ubuntu Mono Nerd Font-14'")
+
+def term_app(cmd):
+    return lazy.function(term_pool.launch, cmd)  # Runs cmd in myTerm, from the warm pool if enabled
 
 keys = [
          ### The essentials
@@ -37,6 +58,10 @@ keys = [
              desc='Kill active window'
              ),
          Key([mod, "shift"], "r",
+             lazy.function(reload.reload),
+             desc='Reload config.py, applying only what changed'
+             ),
+         Key([mod, "control"], "r",
              lazy.restart(),
              desc='Restart Qtile'
              ),
@@ -70,6 +95,27 @@ keys = [
              lazy.prev_screen(),
              desc='Move focus to prev monitor'
              ),
+         ### Move windows between groups and monitors (wraps around at the ends)
+         Key([mod, "control"], "l",
+             lazy.function(nav.window_to_group, 1, True),
+             desc='Move window to next group and follow'
+             ),
+         Key([mod, "control"], "h",
+             lazy.function(nav.window_to_group, -1, True),
+             desc='Move window to previous group and follow'
+             ),
+         Key([mod, "shift"], "period",
+             lazy.function(nav.window_to_screen, 1),
+             desc='Move window to next monitor'
+             ),
+         Key([mod, "shift"], "comma",
+             lazy.function(nav.window_to_screen, -1),
+             desc='Move window to prev monitor'
+             ),
+         Key([mod, "control"], "s",
+             lazy.function(nav.switch_screens),
+             desc='Swap groups with the prev monitor'
+             ),
          ### Treetab controls
          Key([mod, "control"], "k",
              lazy.layout.section_up(),
@@ -81,13 +127,11 @@ keys = [
              ),
          ### Window controls
          Key([mod], "equal",
-             lazy.layout.grow(),
-             lazy.layout.increase_nmaster(),
+             batch.chain(lazy.layout.grow(), lazy.layout.increase_nmaster()),
              desc='Expand window (MonadTall), increase number in master pane (Tile)'
              ),
          Key([mod], "minus",
-             lazy.layout.shrink(),
-             lazy.layout.decrease_nmaster(),
+             batch.chain(lazy.layout.shrink(), lazy.layout.decrease_nmaster()),
              desc='Shrink window (MonadTall), decrease number in master pane (Tile)'
              ),
          Key([mod], "n",
@@ -140,8 +184,7 @@ keys = [
              ),
          ### Stack controls
          Key([mod, "shift"], "space",
-             lazy.layout.rotate(),
-             lazy.layout.flip(),
+             batch.chain(lazy.layout.rotate(), lazy.layout.flip()),
              desc='Switch which side main pane occupies (XmonadTall)'
              ),
          Key([mod], "space",
@@ -152,6 +195,19 @@ keys = [
              lazy.layout.toggle_split(),
              desc='Toggle between split and unsplit sides of stack'
              ),
+         ### Volume controls (the bar follows the change without polling)
+         Key([], "XF86AudioRaiseVolume",
+             lazy.spawn("pactl set-sink-volume @DEFAULT_SINK@ +5%"),
+             desc='Raise volume'
+             ),
+         Key([], "XF86AudioLowerVolume",
+             lazy.spawn("pactl set-sink-volume @DEFAULT_SINK@ -5%"),
+             desc='Lower volume'
+             ),
+         Key([], "XF86AudioMute",
+             lazy.spawn("pactl set-sink-mute @DEFAULT_SINK@ toggle"),
+             desc='Toggle mute'
+             ),
          ### Dmenu scripts launched with ALT + CTRL + KEY
          Key(["mod1", "control"], "e",
              lazy.spawn("./.dmenu/dmenu-edit-configs.sh"),
@@ -162,7 +218,7 @@ keys = [
              desc='Dmenu system monitor script'
              ),
          Key(["mod1", "control"], "p",
-             extension.WindowList(),
+             lazy.function(window_switcher.open),
              desc='Windowlist'
              ),
          Key(["mod1", "control"], "r",
@@ -186,51 +242,51 @@ keys = [
              desc='chrome'
              ),
          Key([mod, "mod1"], "l",
-             lazy.spawn(myTerm+" -e lynx gopher://distro.tube"),
+             term_app("lynx gopher://distro.tube"),
              desc='lynx browser'
              ),
          Key([mod, "mod1"], "n",
-             lazy.spawn(myTerm+" -e newsboat"),
+             term_app("newsboat"),
              desc='newsboat'
              ),
          Key([mod, "mod1"], "r",
-             lazy.spawn(myTerm+" -e rtv"),
+             term_app("rtv"),
              desc='reddit terminal viewer'
              ),
          Key([mod, "mod1"], "e",
-             lazy.spawn(myTerm+" -e neomutt"),
+             term_app("neomutt"),
              desc='neomutt'
              ),
          Key([mod, "mod1"], "m",
-             lazy.spawn(myTerm+" -e sh ./scripts/toot.sh"),
+             term_app("sh ./scripts/toot.sh"),
              desc='toot mastodon cli'
              ),
          Key([mod, "mod1"], "t",
-             lazy.spawn(myTerm+" -e sh ./scripts/tig-script.sh"),
+             term_app("sh ./scripts/tig-script.sh"),
              desc='tig'
              ),
          Key([mod, "mod1"], "f",
-             lazy.spawn(myTerm+" -e sh ./.config/vifm/scripts/vifmrun"),
+             term_app("sh ./.config/vifm/scripts/vifmrun"),
              desc='vifm'
              ),
          Key([mod, "mod1"], "j",
-             lazy.spawn(myTerm+" -e joplin"),
+             term_app("joplin"),
              desc='joplin'
              ),
          Key([mod, "mod1"], "c",
-             lazy.spawn(myTerm+" -e cmus"),
+             term_app("cmus"),
              desc='cmus'
              ),
          Key([mod, "mod1"], "i",
-             lazy.spawn(myTerm+" -e irssi"),
+             term_app("irssi"),
              desc='irssi'
              ),
          Key([mod, "mod1"], "y",
-             lazy.spawn(myTerm+" -e youtube-viewer"),
+             term_app("youtube-viewer"),
              desc='youtube-viewer'
              ),
          Key([mod, "mod1"], "a",
-             lazy.spawn(myTerm+" -e ncpamixer"),
+             term_app("ncpamixer"),
              desc='ncpamixer'
              ),
 ]
@@ -245,12 +301,13 @@ group_names = [("WWW", {'layout': 'monadtall'}),
                ("VID", {'layout': 'floating'}),
                ("GFX", {'layout': 'floating'})]
 
-groups = [Group(name, **kwargs) for name, kwargs in group_names]
-
 for i, (name, kwargs) in enumerate(group_names, 1):
     keys.append(Key([mod], str(i), lazy.group[name].toscreen()))        # Switch to another group
     keys.append(Key([mod, "shift"], str(i), lazy.window.togroup(name))) # Send current window to another group
 
+keys = keymap.validate(keys)                     # Drops (and logs) colliding or action-less bindings
+
+startup.mark("layouts")
 layout_theme = {"border_width": 1,
                 "margin": 6,
                 "border_focus": "e1acff",
@@ -273,6 +330,18 @@ layouts = [
     layout.Floating(**layout_theme)
 ]
 
+startup.mark("groups")
+# Groups start with only their default layout; the rest of the layouts they are
+# allowed are created the first time the group is shown (see grouplayouts.py).
+group_layouts = {"VID": ["floating"], "GFX": ["floating"]}  # Layouts a group cycles through (default: all)
+grouplayouts.idle_limit = 15 * 60                         # Seconds before an empty, hidden group drops them again
+
+groups = [Group(name, layouts=grouplayouts.initial(name, layouts, kwargs['layout'], group_layouts.get(name)), **kwargs)
+          for name, kwargs in group_names]
+if term_pool_size:
+    groups.append(ScratchPad(term_pool.group))  # Hidden parking spot for the warm terminals
+
+startup.mark("widgets")
 colors = [["#0A1318", "#0A1318"], # panel background
           ["#10303C", "#10303C"], # background for current screen tab
           ["#EEEEEE", "#EEEEEE"], # font color for group names
@@ -281,7 +350,7 @@ colors = [["#0A1318", "#0A1318"], # panel background
           ["#06175B", "#06175B"], # color for the even widgets
           ["#238B09", "#238B09"]] # window name
 
-prompt = "{0}@{1}: ".format(os.environ["USER"], socket.gethostname())
+prompt = "{0}@{1}: ".format(os.environ.get("USER", ""), os.uname().nodename)
 
 ##### DEFAULT WIDGET SETTINGS #####
 widget_defaults = dict(
@@ -300,7 +369,7 @@ def init_widgets_list():
                        foreground = colors[2],
                        background = colors[0]
                        ),
-              widget.Image(
+              widgets.Image(
                        #filename = "~/.config/qtile/icons/python.png",
                        filename = "~/.config/qtile/icons/MRCO_Qtile_Logo.jpg",
                        mouse_callbacks = {'Button1': lambda: qtile.cmd_spawn('dmenu_run')}
@@ -346,7 +415,7 @@ def init_widgets_list():
                        foreground = colors[2],
                        background = colors[0]
                        ),
-              widget.WindowName(
+              widgets.WindowName(
                        foreground = colors[6],
                        background = colors[0],
                        padding = 0
@@ -355,7 +424,7 @@ def init_widgets_list():
                        background = colors[0],
                        padding = 5
                        ),
-              widget.TextBox(
+              widgets.Separator(
                        text = u'\uE0B2',
                        background = colors[0],
                        foreground = colors[5],
@@ -369,65 +438,66 @@ def init_widgets_list():
                        background = colors[5],
                        fontsize = 11
                        ),
-              widget.ThermalSensor(
+              sources.View(
+                       source = sources.thermal(),
+                       render = sources.temp_text(threshold = 90),
                        foreground = colors[2],
                        background = colors[5],
-                       threshold = 90,
                        padding = 5
                        ),
-              widget.TextBox(
+              widgets.Separator(
                        text=u'\uE0B2',
                        background = colors[5],
                        foreground = colors[4],
                        padding = 0,
                        fontsize = 37
                        ),
-              widget.CheckUpdates(
-                       update_interval = 1800,
-                       distro = 'Arch',
-                       execute = {'Button1': lambda: qtile.cmd_spawn(myTerm + ' -e sudo pacman -Syu')},
-                       # foreground = colors[2],
-                       background = colors[4],
-                       no_update_string = 'No Updates',
-                       colour_have_updates = "#EEEEEE",
-                       colour_no_updates = "#EEEEEE"
+              sources.View(
+                       source = sources.updates(),
+                       render = sources.updates_text(no_update_string = 'No Updates'),
+                       mouse_callbacks = {'Button1': lambda: qtile.cmd_spawn(myTerm + ' -e sudo pacman -Syu')},
+                       foreground = "#EEEEEE",
+                       background = colors[4]
                        ),
-              widget.TextBox(
+              widgets.Separator(
                        text = u'\uE0B2',
                        background = colors[4],
                        foreground = colors[5],
                        padding = 0,
                        fontsize = 37
                        ),
-              widget.Memory(
+              sources.View(
+                       source = sources.memory(),
+                       render = sources.memory_text,
                        foreground = colors[2],
                        background = colors[5],
                        mouse_callbacks = {'Button1': lambda: qtile.cmd_spawn(myTerm + ' -e htop')},
                        padding = 5
                        ),
-              widget.TextBox(
+              widgets.Separator(
                        text=u'\uE0B2',
                        background = colors[5],
                        foreground = colors[4],
                        padding = 0,
                        fontsize = 37
                        ),
-              widget.DF(
+              sources.View(
+                       source = sources.df('/home'),
+                       render = sources.df_text('/home'),
                        foreground = colors[2],
                        background = colors[4],
                        padding = 5,
-                       visible_on_warn = False,
-                       partition = '/home',
                        mouse_callbacks = {'Button1': lambda: qtile.cmd_spawn('pcmanfm')}
                        ),
-              widget.DF(
+              sources.View(
+                       source = sources.df('/'),
+                       render = sources.df_text('/'),
                        foreground = colors[2],
                        background = colors[4],
                        padding = 5,
-                       visible_on_warn = False,
                        mouse_callbacks = {'Button1': lambda: qtile.cmd_spawn('pcmanfm')}
                        ),
-              widget.TextBox(
+              widgets.Separator(
                        text = u'\uE0B2',
                        background = colors[4],
                        foreground = colors[5],
@@ -441,19 +511,25 @@ def init_widgets_list():
                        padding = 0,
                        mouse_callbacks = {'Button1': lambda: qtile.cmd_spawn('pavucontrol')}
                        ),
-              widget.Volume(
+              sources.View(
+                       source = sources.volume(),
+                       render = sources.volume_text,
                        foreground = colors[2],
                        background = colors[5],
-                       padding = 5
+                       padding = 5,
+                       mouse_callbacks = {'Button1': lambda: qtile.cmd_spawn('pactl set-sink-mute @DEFAULT_SINK@ toggle'),
+                                          'Button3': lambda: qtile.cmd_spawn('pavucontrol'),
+                                          'Button4': lambda: qtile.cmd_spawn('pactl set-sink-volume @DEFAULT_SINK@ +2%'),
+                                          'Button5': lambda: qtile.cmd_spawn('pactl set-sink-volume @DEFAULT_SINK@ -2%')}
                        ),
-              widget.TextBox(
+              widgets.Separator(
                        text = u'\uE0B2',
                        background = colors[5],
                        foreground = colors[4],
                        padding = 0,
                        fontsize = 37
                        ),
-              widget.CurrentLayoutIcon(
+              widgets.CurrentLayoutIcon(
                        custom_icon_paths = [os.path.expanduser("~/.config/qtile/icons")],
                        foreground = colors[0],
                        background = colors[4],
@@ -465,17 +541,18 @@ def init_widgets_list():
                        background = colors[4],
                        padding = 5
                        ),
-              widget.TextBox(
+              widgets.Separator(
                        text = u'\uE0B2',
                        background = colors[4],
                        foreground = colors[5],
                        padding = 0,
                        fontsize = 37
                        ),
-              widget.Clock(
+              sources.View(
+                       source = sources.clock(),
+                       render = sources.clock_text("%A, %B %d  [ %I:%M %p ]"),
                        foreground = colors[2],
-                       background = colors[5],
-                       format = "%A, %B %d  [ %I:%M %p ]"
+                       background = colors[5]
                        ),
               widget.Sep(
                        linewidth = 0,
@@ -494,58 +571,52 @@ def init_widgets_screen1():
     widgets_screen1 = init_widgets_list()
     return widgets_screen1                       # Slicing removes unwanted widgets on Monitors 1,3
 
+# Every screen gets its own widgets, but the pollers behind them (see
+# sources.py) are shared, so screens that aren't plugged in cost nothing.
+num_screens = 3                                  # The to_screen() keys assume three monitors
+
 def init_screens():
-    return [Screen(top=bar.Bar(widgets=init_widgets_screen1(), opacity=1.0, size=20)),
-            Screen(top=bar.Bar(widgets=init_widgets_screen1(), opacity=1.0, size=20))]
+    screens = []
+    for i in range(num_screens):
+        with startup.span("widgets for screen {}".format(i)):
+            screens.append(Screen(top=bar.Bar(widgets=init_widgets_screen1(), opacity=1.0, size=20)))
+    return screens
 
 if __name__ in ["config", "__main__"]:
     screens = init_screens()
-    widgets_list = init_widgets_list()
-    widgets_screen1 = init_widgets_screen1()
-
-def window_to_prev_group(qtile):
-    if qtile.currentWindow is not None:
-        i = qtile.groups.index(qtile.currentGroup)
-        qtile.currentWindow.togroup(qtile.groups[i - 1].name)
-
-def window_to_next_group(qtile):
-    if qtile.currentWindow is not None:
-        i = qtile.groups.index(qtile.currentGroup)
-        qtile.currentWindow.togroup(qtile.groups[i + 1].name)
-
-def window_to_previous_screen(qtile):
-    i = qtile.screens.index(qtile.current_screen)
-    if i != 0:
-        group = qtile.screens[i - 1].group.name
-        qtile.current_window.togroup(group)
-
-def window_to_next_screen(qtile):
-    i = qtile.screens.index(qtile.current_screen)
-    if i + 1 != len(qtile.screens):
-        group = qtile.screens[i + 1].group.name
-        qtile.current_window.togroup(group)
-
-def switch_screens(qtile):
-    i = qtile.screens.index(qtile.current_screen)
-    group = qtile.screens[i - 1].group
-    qtile.current_screen.set_group(group)
+
+startup.mark("mouse, rules, hooks")
+# Floating drags are applied at most once per frame (see drag.py); set
+# drag_rate to the monitor's refresh rate, and outline=True to drag a frame
+# and move/resize the window only on release.
+drag_rate = 60
+dragger = drag.FloatDrag(rate=drag_rate, outline=False)
 
 mouse = [
-    Drag([mod], "Button1", lazy.window.set_position_floating(),
+    Drag([mod], "Button1", lazy.function(dragger.move),
          start=lazy.window.get_position()),
-    Drag([mod], "Button3", lazy.window.set_size_floating(),
+    Drag([mod], "Button3", lazy.function(dragger.resize),
          start=lazy.window.get_size()),
     Click([mod], "Button2", lazy.window.bring_to_front())
 ]
 
 dgroups_key_binder = None
-dgroups_app_rules = []  # type: List
+dgroups_app_rules = []
 main = None
-follow_mouse_focus = True
+# Focus follows the mouse through focus.py instead, which waits for the pointer
+# to settle in a window (focus_dwell seconds) rather than focusing every window
+# it crosses.
+follow_mouse_focus = False
+focus_dwell = 0.08
+mouse_focus = focus.FocusDebounce(dwell=focus_dwell)
 bring_front_click = False
 cursor_warp = False
 
-floating_layout = layout.Floating(float_rules=[
+app_groups = {}  # wm_class -> group name, e.g. {"google-chrome": "WWW"}
+
+# Float rules and app_groups are looked up through a hash index (see rules.py)
+# instead of trying every Match in turn.
+window_rules = rules.RuleIndex([
     *layout.Floating.default_float_rules,
     Match(wm_class='confirmreset'),  # gitk
     Match(wm_class='makebranch'),  # gitk
@@ -553,15 +624,42 @@ floating_layout = layout.Floating(float_rules=[
     Match(wm_class='ssh-askpass'),  # ssh-askpass
     Match(title='branchdialog'),  # gitk
     Match(title='pinentry'),  # GPG key password entry
-])
+], groups=app_groups)
+
+floating_layout = layout.Floating(float_rules=[window_rules])
+
+@hook.subscribe.client_new
+def assign_app_group(client):
+    group = window_rules.group_for(client)
+    if group is not None:
+        client.togroup(group)
 
 auto_fullscreen = True
 focus_on_window_activation = "smart"
 
+@hook.subscribe.startup_complete
+def start_helpers():
+    term_pool.setup(qtile)
+    mouse_focus.setup(qtile)
+    window_switcher.setup(qtile)
+
+##### AUTOSTART #####
+# Started in parallel once per session without blocking qtile; each entry waits
+# only for the services named in after=.  See autostart.py.
+home = os.path.expanduser('~')
+autostart_services = [
+    autostart.Service("autostart.sh", home + '/.config/qtile/autostart.sh', wait=True),
+    #autostart.Service("xrandr", "xrandr --output DisplayPort-0 --auto --output DisplayPort-1 --mode 2560x1440 --rate 144 --left-of DisplayPort-0", wait=True),
+    #autostart.Service("nitrogen", "nitrogen --restore", after=["xrandr"], wait=True),
+    #autostart.Service("picom", "picom", after=["xrandr"]),
+    #autostart.Service("lxsession", "lxsession"),
+    #autostart.Service("volumeicon", "volumeicon"),
+    #autostart.Service("nm-applet", "nm-applet"),
+]
+
 @hook.subscribe.startup_once
 def start_once():
-    home = os.path.expanduser('~')
-    subprocess.call([home + '/.config/qtile/autostart.sh'])
+    autostart.start(autostart_services)
 
 # XXX: Gasp! We're lying here. In fact, nobody really uses or cares about this
 # string besides java UI toolkits; you can see several discussions on the
@@ -573,3 +671,5 @@ def start_once():
 # java that happens to be on java's whitelist.
 wmname = "LG3D"
 
+startup.mark("qtile setup")                      # Runs on to the startup hook (see startup.py)
+
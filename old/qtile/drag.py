@@ -0,0 +1,109 @@
+# Throttled floating move/resize for the mouse Drag bindings.
+#
+# qtile runs a Drag's commands on every pointer motion event, so dragging a
+# window with lazy.window.set_position_floating() sends the X server one
+# configure request per event: a few hundred a second with a fast mouse.
+# Here motion events only record where the window should go; the latest
+# geometry is applied at most once per frame of the display and anything in
+# between is dropped.  With outline=True only a translucent frame follows the
+# pointer and the window itself is moved or resized once, on release.
+#
+# Bound in config.py with lazy.function, which appends the pointer position:
+#   Drag([mod], "Button1", lazy.function(dragger.move),
+#        start=lazy.window.get_position())
+
+import time
+
+from libqtile.log_utils import logger
+
+
+class FloatDrag:
+    """Coalesces drag motion into one update per frame.
+
+    rate: display refresh rate in Hz, i.e. the most updates per second.
+    outline: drag an outline instead of the window and commit on release.
+    """
+
+    def __init__(self, rate=60, outline=False, outline_colour="e1acff", outline_width=2):
+        self.rate = rate
+        self.outline = outline
+        self.outline_colour = outline_colour
+        self.outline_width = outline_width
+        self.window = None
+        self.frame_win = None
+        self.handle = None
+        self.stats = {"drags": 0, "applied": 0, "dropped": 0}
+
+    def move(self, qtile, x, y):
+        self.motion(qtile, "move", x, y)
+
+    def resize(self, qtile, width, height):
+        self.motion(qtile, "resize", width, height)
+
+    def motion(self, qtile, op, a, b):
+        if self.window is None:
+            if qtile.current_window is None:
+                return
+            self.begin(qtile, op)
+        if self.pending is not None:
+            self.dropped += 1
+        self.pending = (a, b)
+        if self.handle is None:
+            delay = max(self.last_frame + 1 / self.rate - time.monotonic(), 0)
+            self.handle = qtile.call_later(delay, self.frame, qtile)
+
+    def begin(self, qtile, op):
+        win = qtile.current_window
+        self.window = win
+        self.op = op
+        self.geometry = [win.x, win.y, win.width, win.height]
+        self.pending = None
+        self.last_frame = 0
+        self.applied = 0
+        self.dropped = 0
+        if self.outline:
+            self.frame_win = qtile.core.create_internal(*self.geometry)
+            self.frame_win.opacity = 0.3
+            self.frame_win.unhide()
+
+    def frame(self, qtile):
+        self.handle = None
+        if self.pending is not None:
+            a, b = self.pending
+            self.pending = None
+            if self.op == "move":
+                self.geometry[:2] = [a, b]
+            else:
+                self.geometry[2:] = [max(a, 1), max(b, 1)]
+            if self.frame_win is not None:
+                self.frame_win.place(*self.geometry, self.outline_width,
+                                     self.outline_colour, above=True)
+            else:
+                self.commit()
+            self.applied += 1
+            self.last_frame = time.monotonic()
+        # qtile clears _drag when the button comes up; until then keep
+        # checking once a frame so the release is noticed without an event.
+        if getattr(qtile, "_drag", None) is None:
+            self.end()
+        else:
+            self.handle = qtile.call_later(1 / self.rate, self.frame, qtile)
+
+    def commit(self):
+        x, y, width, height = self.geometry
+        if self.op == "move":
+            self.window.cmd_set_position_floating(x, y)
+        else:
+            self.window.cmd_set_size_floating(width, height)
+
+    def end(self):
+        if self.frame_win is not None:
+            self.frame_win.kill()
+            self.frame_win = None
+            self.commit()
+        self.stats["drags"] += 1
+        self.stats["applied"] += self.applied
+        self.stats["dropped"] += self.dropped
+        logger.debug("drag: %s applied %d updates, dropped %d motion events",
+                     self.op, self.applied, self.dropped)
+        self.window = None
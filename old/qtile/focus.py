@@ -0,0 +1,91 @@
+# Debounced focus-follows-mouse.
+#
+# With follow_mouse_focus = True qtile focuses every window the pointer
+# crosses, and each of those focus changes recolours two borders, redraws the
+# WindowName widget and fires the focus hooks, even when the pointer is only
+# passing through on its way somewhere else.  With follow_mouse_focus = False
+# and a FocusDebounce set up instead, entering a window only starts a short
+# timer; focus moves once the pointer has stayed put for `dwell` seconds.
+# Keyboard and click focus changes don't go through here and stay immediate;
+# they also cancel any pending mouse focus.
+
+import collections
+import json
+import os
+import time
+
+from libqtile import hook
+from libqtile.log_utils import logger
+
+TRACE_FILE = os.path.expanduser("~/.cache/qtile/focus-trace.json")
+
+
+class FocusDebounce:
+    """Moves focus to the window under the pointer once it settles there.
+
+    dwell: seconds the pointer has to stay in a window before it is focused.
+    record: keep the last pointer crossings and write them to TRACE_FILE on
+        shutdown, for replaying with `bench.py focus`.
+    """
+
+    def __init__(self, dwell=0.08, record=False):
+        self.dwell = dwell
+        self.target = None
+        self.handle = None
+        self.trace = collections.deque(maxlen=10000) if record else None
+        self.stats = {"entered": 0, "focused": 0}
+
+    def setup(self, qtile):
+        self.qtile = qtile
+        hook.subscribe.client_mouse_enter(self.on_enter)
+        hook.subscribe.client_focus(self.on_focus)
+        hook.subscribe.client_killed(self.on_killed)
+        if self.trace is not None:
+            hook.subscribe.shutdown(self.save_trace)
+
+    def cancel(self):
+        if self.handle is not None:
+            self.handle.cancel()
+        self.handle = None
+        self.target = None
+
+    def on_enter(self, client):
+        self.stats["entered"] += 1
+        if self.trace is not None:
+            self.trace.append((time.monotonic(), client.wid))
+        self.cancel()
+        if client is self.qtile.current_window:
+            return
+        self.target = client
+        self.handle = self.qtile.call_later(self.dwell, self.commit)
+
+    def on_focus(self, client):
+        # Focus moved some other way (keyboard, click, a new window).
+        if client is not self.target:
+            self.cancel()
+
+    def on_killed(self, client):
+        if client is self.target:
+            self.cancel()
+
+    def commit(self):
+        client = self.target
+        self.handle = None
+        self.target = None
+        if client is None or client.group is None:
+            return
+        self.stats["focused"] += 1
+        # What qtile itself does on EnterNotify with follow_mouse_focus.
+        if client.group.current_window is not client:
+            client.group.focus(client, False)
+        screen = client.group.screen
+        if screen is not None and self.qtile.current_screen is not screen:
+            self.qtile.focus_screen(screen.index, False)
+
+    def save_trace(self):
+        try:
+            os.makedirs(os.path.dirname(TRACE_FILE), exist_ok=True)
+            with open(TRACE_FILE, "w") as f:
+                json.dump(list(self.trace), f)
+        except OSError:
+            logger.exception("could not write %s", TRACE_FILE)
@@ -0,0 +1,96 @@
+# Per-group layouts, created when the group is first shown.
+#
+# qtile clones every layout in `layouts` into every group when it starts, and
+# keeps all of them fed with every window of the group, whether the group is
+# ever looked at or not.  Here each group starts out with only its default
+# layout; the rest of its allowed layouts are cloned (and given the group's
+# current windows) the first time the group is put on a screen.  Groups that
+# have been off screen and empty for longer than the idle limit drop back to
+# just their current layout.
+#
+# Restarts restore each group's layout by name before any group is shown, so
+# on a restart every group gets its full set straight away.
+
+import time
+
+from libqtile import hook, qtile
+
+# Group name -> layout templates the group may use, in cycling order.
+_allowed = {}
+_last_seen = {}
+idle_limit = 15 * 60
+_fresh_start = False
+
+
+def initial(name, layouts, default, allowed=None):
+    """Layouts to pass to Group(): just the default one, out of those allowed.
+
+    allowed is a list of layout names (e.g. ["floating"]); None allows all.
+    """
+    templates = [l for l in layouts if allowed is None or l.name in allowed]
+    _allowed[name] = templates
+    return [next((l for l in templates if l.name == default), templates[0])]
+
+
+def expand(group):
+    templates = _allowed.get(group.name)
+    if templates is None or len(group.layouts) == len(templates):
+        return
+    current = group.layout
+    existing = {l.name: l for l in group.layouts}
+    # tiled_windows, not "not floating": fullscreen windows count as floating
+    # but stay in the layouts, and are only re-added to a layout when they
+    # leave fullscreen if they aren't in tiled_windows already.
+    tiled = [w for w in group.windows if w in group.tiled_windows]
+    expanded = []
+    for template in templates:
+        layout = existing.get(template.name)
+        if layout is None:
+            layout = template.clone(group)
+            for win in tiled:
+                layout.add(win)
+            if group.current_window in tiled:
+                layout.focus(group.current_window)
+        expanded.append(layout)
+    group.layouts = expanded
+    group.current_layout = expanded.index(current)
+
+
+def compact(group):
+    if len(group.layouts) > 1 and not group.windows:
+        current = group.layout
+        for layout in group.layouts:
+            if layout is not current:
+                layout.finalize()
+        group.layouts = [current]
+        group.current_layout = 0
+
+
+def on_setgroup():
+    now = time.monotonic()
+    for screen in qtile.screens:
+        if screen.group is not None:
+            expand(screen.group)
+            _last_seen[screen.group.name] = now
+    visible = {screen.group for screen in qtile.screens}
+    for group in qtile.groups:
+        if group not in visible and now - _last_seen.get(group.name, now) > idle_limit:
+            compact(group)
+
+
+def on_startup_once():
+    global _fresh_start
+    _fresh_start = True
+
+
+def on_startup():
+    # qtile sets no_spawn before firing startup, so it can't tell a restart
+    # apart; startup_once only fires (first) on a fresh start.
+    if not _fresh_start:
+        for group in qtile.groups:
+            expand(group)
+
+
+hook.subscribe.setgroup(on_setgroup)
+hook.subscribe.startup_once(on_startup_once)
+hook.subscribe.startup(on_startup)
@@ -0,0 +1,110 @@
+# Key binding table.
+#
+# Compiles the keys list into a table keyed by (modifier mask, keysym name),
+# the same pair X tells grabs apart by, and rejects bindings that can't work
+# before qtile grabs them: a second binding on the same combination (qtile
+# would silently let it replace the first) and bindings without any action.
+
+from libqtile.log_utils import logger
+
+MODMASKS = {
+    "shift": 1 << 0,
+    "lock": 1 << 1,
+    "control": 1 << 2,
+    "mod1": 1 << 3,
+    "mod2": 1 << 4,
+    "mod3": 1 << 5,
+    "mod4": 1 << 6,
+    "mod5": 1 << 7,
+}
+
+# The running bindings by (modifier mask, keysym): set by validate() when
+# config.py loads, diffed against and updated by reload.apply_keys().
+table = {}
+
+
+def modmask(modifiers):
+    mask = 0
+    for modifier in modifiers:
+        mask |= MODMASKS[modifier]
+    return mask
+
+
+def spec(key):
+    return (modmask(key.modifiers), key.key)
+
+
+def keyname(key):
+    return "+".join(list(key.modifiers) + [key.key])
+
+
+def argument(value):
+    # By name, so lazy.function(obj.method) reads (and compares) the same
+    # whichever instance it was bound to; lazy calls passed along (batch
+    # chains) are described like commands.
+    if hasattr(value, "selectors") and hasattr(value, "name"):
+        return describe(value)
+    if isinstance(value, (list, tuple)):
+        return "[{}]".format(", ".join(argument(v) for v in value))
+    if callable(value):
+        return getattr(value, "__qualname__", type(value).__name__)
+    return repr(value)
+
+
+def describe(command):
+    if hasattr(command, "selectors") and hasattr(command, "name"):
+        path = ".".join(name if selector is None else "{}[{!r}]".format(name, selector)
+                        for name, selector in command.selectors)
+        args = [argument(arg) for arg in command.args]
+        args += ["{}={}".format(name, argument(value))
+                 for name, value in sorted(getattr(command, "kwargs", {}).items())]
+        return "{}{}{}({})".format(path, "." if path else "", command.name, ", ".join(args))
+    return type(command).__name__
+
+
+def compile_keys(keys):
+    """Returns (table, rejected, report) for a list of Key objects.
+
+    rejected holds the keys that didn't make it into the table, report one
+    line per problem.  Bindings that merely repeat another binding's action
+    are kept but still reported.
+    """
+    compiled = {}
+    actions = {}
+    rejected = []
+    report = []
+    for key in keys:
+        name = keyname(key)
+        if not key.commands:
+            rejected.append(key)
+            report.append("{} ({}) has no action".format(name, key.desc or "no description"))
+            continue
+        try:
+            combo = spec(key)
+        except KeyError as err:
+            rejected.append(key)
+            report.append("{} uses unknown modifier {}".format(name, err))
+            continue
+        if combo in compiled:
+            rejected.append(key)
+            report.append("{} is already bound to {}".format(
+                name, ", ".join(describe(c) for c in compiled[combo].commands)))
+            continue
+        compiled[combo] = key
+
+        action = tuple(describe(c) for c in key.commands)
+        if action in actions:
+            report.append("{} repeats the action of {}: {}".format(
+                name, actions[action], ", ".join(action)))
+        else:
+            actions[action] = name
+    return compiled, rejected, report
+
+
+def validate(keys):
+    """Compiles keys, logs the report and returns only the usable bindings."""
+    global table
+    table, rejected, report = compile_keys(keys)
+    for line in report:
+        logger.warning("keys: %s", line)
+    return [key for key in keys if key not in rejected]
@@ -0,0 +1,138 @@
+# Pre-warmed terminals for the SUPER+ALT application bindings.
+#
+# Cold-starting the terminal is most of the delay between pressing a key and
+# seeing newsboat/neomutt/cmus.  With a pool size above zero, that many
+# terminals are started ahead of time and parked in a hidden ScratchPad
+# group, each running a tiny shell blocked on its own FIFO.  A launch writes
+# the command into the FIFO (the shell execs it in place), moves the window
+# to the current group and starts a replacement in the background.  With an
+# empty pool, or a pool size of 0, launches fall back to a normal spawn.
+#
+# Launch latency is logged for both kinds, from the key press until the
+# launched window has focus in the current group, so the two are comparable.
+
+import os
+import time
+
+from libqtile import hook
+from libqtile.log_utils import logger
+
+# Waits for one command on the FIFO given as $1 and replaces itself with it.
+WAITER = 'read -r cmd < "$1"; rm -f "$1"; exec sh -c "$cmd"'
+
+
+class Slot:
+    def __init__(self, fifo, pid):
+        self.fifo = fifo
+        self.pid = pid
+        self.window = None
+
+
+class TermPool:
+    def __init__(self, term, size=0, group="termpool", wm_class="termpool"):
+        self.term = term
+        self.size = size
+        self.group = group
+        self.wm_class = wm_class
+        self.slots = []
+        self.cold = {}
+        self.waiting = {}
+        self.serial = 0
+        self.latency = []
+        self.qtile = None
+
+    def setup(self, qtile):
+        self.qtile = qtile
+        hook.subscribe.client_new(self.on_client_new)
+        hook.subscribe.client_killed(self.on_client_killed)
+        hook.subscribe.client_focus(self.on_client_focus)
+        hook.subscribe.shutdown(self.on_shutdown)
+        self.fill()
+
+    def fifo_path(self):
+        self.serial += 1
+        runtime = os.environ.get("XDG_RUNTIME_DIR", "/tmp")
+        return os.path.join(runtime, "qtile-termpool-{}-{}".format(os.getpid(), self.serial))
+
+    def fill(self):
+        while len(self.slots) < self.size:
+            fifo = self.fifo_path()
+            os.mkfifo(fifo, 0o600)
+            pid = self.qtile.cmd_spawn([self.term, "--class", self.wm_class,
+                                        "-e", "sh", "-c", WAITER, "termpool", fifo])
+            if pid <= 0:
+                os.unlink(fifo)
+                return
+            self.slots.append(Slot(fifo, pid))
+
+    def on_client_new(self, client):
+        pid = client.get_pid()
+        for slot in self.slots:
+            if slot.pid == pid:
+                slot.window = client
+                client.togroup(self.group)
+                return
+        if pid in self.cold:
+            cmd, pressed = self.cold.pop(pid)
+            self.waiting[client] = (cmd, "cold", pressed)
+
+    def on_client_focus(self, client):
+        if client in self.waiting:
+            self.record(*self.waiting.pop(client))
+
+    def on_client_killed(self, client):
+        self.waiting.pop(client, None)
+        for slot in self.slots:
+            if slot.window is client:
+                self.slots.remove(slot)
+                if os.path.exists(slot.fifo):
+                    os.unlink(slot.fifo)
+                self.qtile.call_soon(self.fill)
+                return
+
+    def on_shutdown(self):
+        for slot in self.slots:
+            if os.path.exists(slot.fifo):
+                os.unlink(slot.fifo)
+
+    def record(self, cmd, mode, pressed):
+        elapsed = (time.monotonic() - pressed) * 1000
+        self.latency.append((cmd, mode, elapsed))
+        logger.info("launched %s (%s) in %.0fms", cmd, mode, elapsed)
+
+    def spawn(self, qtile, cmd, pressed):
+        pid = qtile.cmd_spawn("{} -e {}".format(self.term, cmd))
+        if pid > 0:
+            self.cold[pid] = (cmd, pressed)
+
+    def launch(self, qtile, cmd):
+        """Runs cmd in a terminal, handing off a warm one when available."""
+        pressed = time.monotonic()
+        ready = [slot for slot in self.slots if slot.window is not None]
+        if not ready:
+            self.spawn(qtile, cmd, pressed)
+            return
+
+        slot = ready[0]
+        self.slots.remove(slot)
+        qtile.call_soon(self.fill)
+        try:
+            fd = os.open(slot.fifo, os.O_WRONLY | os.O_NONBLOCK)
+            try:
+                os.write(fd, cmd.encode() + b"\n")
+            finally:
+                os.close(fd)
+        except OSError:
+            # ENXIO: nothing has the FIFO open for reading, the shell in that
+            # terminal died or never got that far.  Drop it and start cold.
+            logger.warning("termpool: terminal %d isn't waiting, cold-starting %s",
+                           slot.pid, cmd)
+            if os.path.exists(slot.fifo):
+                os.unlink(slot.fifo)
+            slot.window.kill()
+            self.spawn(qtile, cmd, pressed)
+            return
+        group = qtile.current_group
+        self.waiting[slot.window] = (cmd, "warm", pressed)
+        slot.window.togroup(group.name)
+        group.focus(slot.window)
@@ -0,0 +1,67 @@
+# Group and screen navigation.
+#
+# The old helpers found the current group with qtile.groups.index(), a list
+# scan on every keypress, and fell off the end of the list on the last group.
+# Here the group order lives in a name -> position map that is rebuilt only
+# when groups are added or removed (via hooks), screens are looked up by
+# their own index, and moving past either end wraps around.
+#
+# Everything is meant to be bound with lazy.function, e.g.
+#   Key([mod, "control"], "l", lazy.function(nav.window_to_group, 1, True))
+
+from libqtile import hook
+
+# Group names in order and their positions, skipping hidden groups
+# (ScratchPads have an empty label).  None means "rebuild on next use".
+_names = None
+_index = {}
+
+
+def invalidate(*args):
+    global _names
+    _names = None
+
+
+hook.subscribe.addgroup(invalidate)
+hook.subscribe.delgroup(invalidate)
+hook.subscribe.changegroup(invalidate)
+
+
+def group_names(qtile):
+    global _names, _index
+    if _names is None:
+        _names = [g.name for g in qtile.groups if getattr(g, "label", g.name) != ""]
+        _index = {name: i for i, name in enumerate(_names)}
+    return _names
+
+
+def neighbour_group(qtile, offset):
+    names = group_names(qtile)
+    i = _index.get(qtile.current_group.name, 0)
+    return names[(i + offset) % len(names)]
+
+
+def neighbour_screen(qtile, offset):
+    i = qtile.current_screen.index
+    return qtile.screens[(i + offset) % len(qtile.screens)]
+
+
+def window_to_group(qtile, offset, follow=False):
+    """Sends the focused window offset groups over, wrapping around."""
+    if qtile.current_window is not None:
+        qtile.current_window.togroup(neighbour_group(qtile, offset), switch_group=follow)
+
+
+def window_to_screen(qtile, offset, follow=False):
+    """Sends the focused window to the group on the screen offset screens over."""
+    if qtile.current_window is None or len(qtile.screens) < 2:
+        return
+    screen = neighbour_screen(qtile, offset)
+    qtile.current_window.togroup(screen.group.name)
+    if follow:
+        qtile.focus_screen(screen.index)
+
+
+def switch_screens(qtile, offset=-1):
+    """Swaps the group on this screen with the one on the screen offset over."""
+    qtile.current_screen.set_group(neighbour_screen(qtile, offset).group)
@@ -0,0 +1,339 @@
+# Config reload without a restart.
+#
+# lazy.restart() re-executes the whole process: libqtile is imported again,
+# every bar and widget is rebuilt and every poller starts over.  reload()
+# instead runs config.py again as a throwaway module (with qtile's hook
+# subscriptions put back afterwards, so its @hook.subscribe lines don't
+# register twice), compares it with what is running and applies only the
+# difference:
+#
+#   keys      changed, added and removed bindings are ungrabbed/grabbed,
+#             with methods of the switcher, term pool etc. bound to the
+#             running instances rather than the reloaded copies
+#   layouts   changed settings are set on every group's live copy
+#   rules     edited float rules and app_groups replace the running
+#             RuleIndex's contents (see rules.py)
+#   screens   changed widget settings (colours, fonts, ...) are set on the
+#             live widgets, whose pollers and state are kept
+#
+# Anything that changes the shape of the session (different groups, layouts
+# added or removed, widgets added, removed or reordered, bar sizes) falls
+# back to a real restart, as does removing a layout or widget setting (its
+# default isn't known here), and so does editing any other top-level
+# statement (mouse, floating rules, focus settings, autostart, ...): the
+# statements of both versions of config.py are compared, and only the names
+# in APPLIED may differ.  A config that fails to load is logged and the
+# running one is kept.
+
+import ast
+import collections
+import sys
+import time
+import types
+
+from libqtile import hook
+from libqtile.log_utils import logger
+
+import keymap
+
+# Top-level names whose changes reload() applies itself, and the helpers
+# that only build them.  An edit to any other top-level statement restarts.
+APPLIED = {"keys", "term_app", "layouts", "layout_theme", "screens", "colors",
+           "widget_defaults", "extension_defaults", "prompt",
+           "init_widgets_list", "init_widgets_screen1", "init_screens",
+           "window_rules", "app_groups"}
+
+
+def read(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except (OSError, TypeError):
+        return None
+
+
+# The config module the running session corresponds to, and its source.
+# reload.py is first imported by config.py itself, so the file read here is
+# the one qtile is running.
+_current = None
+_source = read(getattr(sys.modules.get("config"), "__file__", None))
+
+
+def load(path, source):
+    # config.py's keymap.validate() replaces keymap.table, which has to keep
+    # describing the running bindings until apply_keys() diffs against it.
+    saved = {name: list(funcs) for name, funcs in hook.subscriptions.items()}
+    table = keymap.table
+    try:
+        module = types.ModuleType("config")
+        module.__file__ = path
+        exec(compile(source, path, "exec"), vars(module))
+    finally:
+        hook.subscriptions.clear()
+        hook.subscriptions.update(saved)
+        keymap.table = table
+    return module
+
+
+def bound_names(node):
+    """Top-level names (and dotted attributes) a statement assigns."""
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return {node.name}
+    if isinstance(node, (ast.For, ast.AsyncFor)):
+        # The loop variables are scratch; only what the body assigns counts.
+        return set().union(*(bound_names(child) for child in node.body + node.orelse))
+    names = set()
+    targets = getattr(node, "targets", None) or [getattr(node, "target", None)]
+    for target in targets:
+        if isinstance(target, ast.Attribute):
+            names.add(ast.unparse(target) if hasattr(ast, "unparse") else ast.dump(target))
+    for child in ast.walk(node):
+        if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Store):
+            names.add(child.id)
+        elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(child.name)
+    return names
+
+
+def statements(source):
+    """{name: [every top-level statement assigning it, dumped]}."""
+    bound = collections.defaultdict(list)
+    for node in ast.parse(source).body:
+        for name in bound_names(node):
+            bound[name].append(ast.dump(node))
+    return bound
+
+
+def edited(old_source, new_source):
+    """Top-level names whose statements differ."""
+    old, new = statements(old_source), statements(new_source)
+    return {name for name in old.keys() | new.keys() if old.get(name) != new.get(name)}
+
+
+def comparable(value):
+    if callable(value):
+        return False
+    if isinstance(value, dict):
+        return not any(callable(v) for v in value.values())
+    return True
+
+
+def settings(obj, defaults=None):
+    """What obj was configured with, minus callbacks (which never compare equal)."""
+    merged = dict(defaults or {})
+    merged.update(getattr(obj, "_user_config", {}))
+    return {name: value for name, value in merged.items() if comparable(value)}
+
+
+def changes(old, new):
+    """Settings that differ in new, or None if new drops a setting old had.
+
+    A dropped setting would have to go back to its default, which isn't
+    known from here, so the caller restarts instead.
+    """
+    if old.keys() - new.keys():
+        return None
+    return {name: value for name, value in new.items() if old.get(name) != value}
+
+
+def group_shape(groups):
+    return [(g.name, g.label, g.layout, [l.name for l in g.layouts or []]) for g in groups]
+
+
+def screen_shape(screens):
+    shape = []
+    for screen in screens:
+        bars = []
+        for position in ("top", "bottom", "left", "right"):
+            bar = getattr(screen, position)
+            if bar is not None:
+                bars.append((position, bar.size, [type(w).__name__ for w in bar.widgets]))
+        shape.append(bars)
+    return shape
+
+
+def reshaped(qtile, new):
+    if group_shape(qtile.config.groups) != group_shape(new.groups):
+        return "groups"
+    if [l.name for l in qtile.config.layouts] != [l.name for l in new.layouts]:
+        return "layouts"
+    if screen_shape(qtile.config.screens) != screen_shape(new.screens):
+        return "screens"
+    return None
+
+
+def helpers(old, new):
+    """The running module's objects, by id() of their counterpart in new.
+
+    Only instances (the switcher, the term pool, ...): those were set up
+    and hooked in by the running config, their copies in new never are.
+    """
+    running = {}
+    for name, value in vars(new).items():
+        live = getattr(old, name, None)
+        if (live is not None and live is not value and type(live) is type(value)
+                and type(value).__module__ != "builtins"
+                and not isinstance(value, (type, types.ModuleType, types.FunctionType))):
+            running[id(value)] = live
+    return running
+
+
+def rebind(value, running):
+    """value, with methods of new's helpers swapped for the running ones'."""
+    owner = getattr(value, "__self__", None)
+    if owner is not None and id(owner) in running:
+        return getattr(running[id(owner)], value.__name__)
+    if hasattr(value, "selectors") and hasattr(value, "name"):
+        # A LazyCall (say lazy.function(window_switcher.open)); its args are
+        # read-only properties over _args/_kwargs.
+        args = "_args" if hasattr(value, "_args") else "args"
+        kwargs = "_kwargs" if hasattr(value, "_kwargs") else "kwargs"
+        setattr(value, args, rebind(tuple(value.args), running))
+        setattr(value, kwargs, {k: rebind(v, running) for k, v in value.kwargs.items()})
+        return value
+    if isinstance(value, (list, tuple)):
+        return type(value)(rebind(v, running) for v in value)
+    return value
+
+
+def apply_keys(qtile, keys, running):
+    old = keymap.table or keymap.compile_keys(qtile.config.keys)[0]
+    new = keymap.compile_keys(keys)[0]
+    merged, changed = [], 0
+    for combo, key in new.items():
+        before = old.get(combo)
+        if before is not None and ([keymap.describe(c) for c in before.commands]
+                                   == [keymap.describe(c) for c in key.commands]):
+            # Unchanged: keep the running binding and whatever it is bound to.
+            merged.append(before)
+            continue
+        if before is not None:
+            qtile.ungrab_key(before)
+        key.commands = [rebind(command, running) for command in key.commands]
+        qtile.grab_key(key)
+        merged.append(key)
+        changed += 1
+    for combo in old.keys() - new.keys():
+        qtile.ungrab_key(old[combo])
+        changed += 1
+    qtile.config.keys = merged
+    keymap.table = {keymap.spec(key): key for key in merged}
+    return changed
+
+
+def layout_changes(qtile, layouts):
+    """[(layout name, changed settings)], or None if a setting was removed."""
+    planned = []
+    for before, after in zip(qtile.config.layouts, layouts):
+        diff = changes(settings(before), settings(after))
+        if diff is None:
+            return None
+        if diff:
+            planned.append((after.name, diff))
+    return planned
+
+
+def apply_layouts(qtile, layouts, planned):
+    changed = 0
+    for layout_name, diff in planned:
+        changed += 1
+        for group in qtile.groups:
+            for live in group.layouts:
+                if live.name == layout_name:
+                    for name, value in diff.items():
+                        setattr(live, name, value)
+    qtile.config.layouts = layouts
+    if changed:
+        for screen in qtile.screens:
+            if screen.group is not None:
+                screen.group.layout_all()
+    return changed
+
+
+def widget_changes(qtile, old, new):
+    """{bar: [(widget, changed settings)]}, or None if a setting was removed.
+
+    Only bars qtile actually configured count: config.py builds a bar for
+    every screen it knows about, plugged in or not.
+    """
+    planned = {}
+    old_defaults = getattr(old, "widget_defaults", {})
+    new_defaults = getattr(new, "widget_defaults", {})
+    for running, screen in zip(qtile.config.screens, new.screens):
+        for position in ("top", "bottom", "left", "right"):
+            bar = getattr(running, position)
+            if bar is None or getattr(bar, "qtile", None) is None:
+                continue
+            for live, fresh in zip(bar.widgets, getattr(screen, position).widgets):
+                diff = changes(settings(live, old_defaults), settings(fresh, new_defaults))
+                if diff is None:
+                    return None
+                if diff:
+                    planned.setdefault(bar, []).append((live, diff))
+    return planned
+
+
+def apply_widgets(planned):
+    changed = 0
+    for bar, widgets in planned.items():
+        for live, diff in widgets:
+            for name, value in diff.items():
+                setattr(live, name, value)
+            if "fontsize" in diff and getattr(live, "layout", None) is not None:
+                # _TextBox only forwards font, fontshadow and foreground to
+                # its TextLayout; the size has to be pushed by hand.
+                live.layout.font_size = diff["fontsize"]
+            live._user_config.update(diff)
+            changed += 1
+        bar.draw()
+    return changed
+
+
+def apply_rules(old, new, names):
+    if not names & {"window_rules", "app_groups"}:
+        return 0
+    old.window_rules.replace(new.window_rules)
+    return 1
+
+
+def reload(qtile):
+    """Applies the differences between config.py on disk and the running config."""
+    global _current, _source
+    start = time.monotonic()
+    path = qtile.config.file_path
+    source = read(path)
+    if source is None:
+        logger.error("reload: can't read %s, keeping the running config", path)
+        return
+    try:
+        new = load(path, source)
+    except Exception:
+        logger.exception("reload: %s failed to load, keeping the running config", path)
+        return
+    old = _current or sys.modules.get("config")
+
+    reason = reshaped(qtile, new)
+    planned_layouts = layout_changes(qtile, new.layouts)
+    planned_widgets = widget_changes(qtile, old, new)
+    if reason is None and (planned_layouts is None or planned_widgets is None):
+        reason = "removed settings"
+    # Without the running source nothing outside APPLIED can be ruled out.
+    names = edited(_source, source) if _source is not None else {"config.py"}
+    if reason is None and names - APPLIED:
+        reason = ", ".join(sorted(names - APPLIED))
+    if reason is not None:
+        logger.info("reload: %s changed, restarting instead", reason)
+        qtile.cmd_restart()
+        return
+
+    touched = [name for name in ("colors", "widget_defaults")
+               if getattr(old, name, None) != getattr(new, name, None)]
+    keys = apply_keys(qtile, new.keys, helpers(old, new))
+    layouts = apply_layouts(qtile, new.layouts, planned_layouts)
+    widgets = apply_widgets(planned_widgets)
+    rules = apply_rules(old, new, names)
+    _current, _source = new, source
+    logger.info("reload: %d keys, %d layouts, %d widgets changed%s%s in %.1fms",
+                keys, layouts, widgets, ", float rules replaced" if rules else "",
+                " ({} edited)".format(", ".join(touched)) if touched else "",
+                (time.monotonic() - start) * 1000)
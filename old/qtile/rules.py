@@ -0,0 +1,96 @@
+# Indexed window rules.
+#
+# layout.Floating tests every new window against each Match in float_rules in
+# turn, so mapping a window gets slower with every rule added.  RuleIndex
+# takes the same Match objects and sorts them by what they test: exact
+# wm_class, role, wm_type and title values go into sets, regular expressions
+# are joined into one pattern per property, and only rules it can't index
+# (func=..., multi-property matches) are still tried one by one.  It also
+# answers which group a window belongs in, for the client_new hook.
+
+import re
+
+INDEXED = ("wm_class", "role", "wm_type", "title")
+
+
+def combine(patterns):
+    if not patterns:
+        return None
+    return re.compile("|".join("(?:{})".format(p.pattern) for p in patterns))
+
+
+class RuleIndex:
+    """Drop-in float rule: layout.Floating only ever calls compare().
+
+    Results that only depend on the window's wm_class, role and type are
+    memoized per window kind.  replace() takes over a reloaded config's rules
+    in place, dropping the memo; invalidate() clears the memo by hand.
+    """
+
+    def __init__(self, matches=(), groups=None):
+        exact = {name: set() for name in INDEXED}
+        patterns = {name: [] for name in INDEXED}
+        self.fallback = []
+        for match in matches:
+            rules = getattr(match, "_rules", {})
+            if len(rules) != 1 or next(iter(rules)) not in INDEXED:
+                self.fallback.append(match)
+                continue
+            name, value = next(iter(rules.items()))
+            if hasattr(value, "pattern"):
+                # Flags can't be merged into one pattern, so those stay separate.
+                if value.flags != re.UNICODE:
+                    self.fallback.append(match)
+                    continue
+                patterns[name].append(value)
+            else:
+                exact[name].add(value)
+        self.exact = exact
+        self.patterns = {name: combine(patterns[name]) for name in INDEXED}
+        self.groups = dict(groups or {})
+        self.memo = {}
+        self.group_memo = {}
+
+    def invalidate(self):
+        self.memo.clear()
+        self.group_memo.clear()
+
+    def replace(self, other):
+        # In place, because the floating layouts (and their per-group clones)
+        # and the client_new hook all hold on to this index.
+        vars(self).update(vars(other))
+        self.memo = {}
+        self.group_memo = {}
+
+    def search(self, name, values):
+        if any(value in self.exact[name] for value in values):
+            return True
+        pattern = self.patterns[name]
+        return pattern is not None and any(pattern.match(value) for value in values)
+
+    def kind(self, client):
+        return (tuple(client.get_wm_class() or ()), client.get_wm_role(), client.get_wm_type())
+
+    def compare(self, client):
+        kind = self.kind(client)
+        hit = self.memo.get(kind)
+        if hit is None:
+            wm_class, role, wm_type = kind
+            hit = self.memo[kind] = (
+                self.search("wm_class", wm_class)
+                or self.search("role", [role] if role else [])
+                or self.search("wm_type", [wm_type] if wm_type else [])
+            )
+        if hit:
+            return True
+        if client.name and self.search("title", [client.name]):
+            return True
+        return any(match.compare(client) for match in self.fallback)
+
+    def group_for(self, client):
+        wm_class = tuple(client.get_wm_class() or ())
+        if wm_class not in self.group_memo:
+            self.group_memo[wm_class] = next(
+                (self.groups[c] for c in wm_class if c in self.groups), None)
+        return self.group_memo[wm_class]
+
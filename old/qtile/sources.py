@@ -0,0 +1,660 @@
+# Shared data sources for the bar widgets.
+#
+# Qtile only lets a widget live in one bar, so every screen needs its own set
+# of widgets.  The expensive part of most of them is the polling though, so the
+# pollers live here, once per process, and the widgets on each screen are cheap
+# views that render whatever their source produced last.  Adding a monitor adds
+# a few text layouts, not another round of pacman/statvfs/sensor reads.
+
+import asyncio
+import collections
+import concurrent.futures
+import glob
+import json
+import math
+import os
+import re
+import shutil
+import subprocess
+import time
+
+from libqtile import hook
+from libqtile.log_utils import logger
+from libqtile.widget import base
+
+_sources = {}
+
+
+class Scheduler:
+    """One timer for every source instead of one timer each.
+
+    Due times are aligned to multiples of each source's interval on the wall
+    clock, so sources with the same (or a dividing) interval always come due
+    in the same wakeup and their /proc and /sys reads are done back to back.
+    Views don't draw when their value changes, they report it to damage and
+    get repainted together once the batch is done.
+
+    The scheduler only ever has one handle on the event loop, and only while
+    at least one source has a subscribed view.  That handle runs on the
+    loop's monotonic clock, which stands still during suspend, so on resume
+    every source that came due meanwhile is run straight away.
+    """
+
+    def __init__(self):
+        self.sources = []
+        self.handle = None
+        self.latency = {}
+
+    def add(self, source):
+        if source not in self.sources:
+            source.due = self.next_due(source, time.time())
+            self.sources.append(source)
+            self.reschedule()
+
+    def remove(self, source):
+        if source in self.sources:
+            self.sources.remove(source)
+            if self.sources:
+                self.reschedule()
+            elif self.handle is not None:
+                self.handle.cancel()
+                self.handle = None
+
+    def next_due(self, source, now):
+        return (math.floor(now / source.update_interval) + 1) * source.update_interval
+
+    def reschedule(self):
+        if self.handle is not None:
+            self.handle.cancel()
+        due = min(source.due for source in self.sources)
+        # Wake a hair late so wall-clock sources (the clock) see the new value.
+        delay = max(due - time.time(), 0) + 0.01
+        self.handle = asyncio.get_event_loop().call_later(delay, self.run)
+
+    def run(self):
+        self.handle = None
+        now = time.time()
+        for source in self.sources:
+            if source.due <= now:
+                source.tick()
+                source.due = self.next_due(source, now)
+        self.reschedule()
+
+    def resume(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.run()
+
+    def record(self, source, elapsed):
+        last, worst, count, total = self.latency.get(source.name, (0, 0, 0, 0))
+        self.latency[source.name] = (elapsed, max(worst, elapsed), count + 1, total + elapsed)
+
+    def stats(self):
+        """Poll latency per source in milliseconds: last, max and mean."""
+        return {
+            name: {"last": last * 1000, "max": worst * 1000, "mean": total / count * 1000}
+            for name, (last, worst, count, total) in self.latency.items()
+        }
+
+
+
+scheduler = Scheduler()
+hook.subscribe.resume(scheduler.resume)
+
+
+class Damage:
+    """Collects changed widgets and repaints only what changed.
+
+    Widgets whose length stayed the same are redrawn on their own, which
+    flushes just their span of the bar.  A bar is only laid out and repainted
+    as a whole when one of its damaged widgets actually changed length.
+    Everything damaged during one pass of the event loop is painted together.
+    """
+
+    def __init__(self):
+        self.widgets = {}
+        self.handle = None
+        self.stats = {"partial": 0, "full": 0}
+
+    def update(self, widget, text):
+        if text == widget.text:
+            return
+        old_length = widget.length
+        widget.text = text
+        self.add(widget, widget.length != old_length)
+
+    def add(self, widget, resized=False):
+        self.widgets[widget] = self.widgets.get(widget, False) or resized
+        if self.handle is None:
+            self.handle = asyncio.get_event_loop().call_soon(self.flush)
+
+    def flush(self):
+        self.handle = None
+        bars = {}
+        for widget, resized in self.widgets.items():
+            bars.setdefault(widget.bar, []).append((widget, resized))
+        self.widgets = {}
+        for bar, damaged in bars.items():
+            if any(resized for _, resized in damaged):
+                self.stats["full"] += 1
+                bar.draw()
+                continue
+            for widget, _ in damaged:
+                self.stats["partial"] += 1
+                widget.draw()
+
+
+damage = Damage()
+
+
+class Source:
+    """Polls one value and pushes it to every subscribed view.
+
+    A source is only handed to the scheduler once its first view is
+    configured, so a source whose views end up on a screen that isn't plugged
+    in never polls at all, and leaves it again when its last view goes.
+    Blocking polls (subprocesses, statvfs) run in the default executor so they
+    never stall the event loop; only one of them is in flight at a time.
+    """
+
+    def __init__(self, name, poll, update_interval, blocking=False):
+        self.name = name
+        self.poll = poll
+        self.update_interval = update_interval
+        self.blocking = blocking
+        self.value = None
+        self.views = []
+        self.due = None
+        self.polling = False
+
+    def subscribe(self, view):
+        self.views.append(view)
+        if self.value is not None:
+            view.refresh(self.value)
+        else:
+            self.tick()
+        scheduler.add(self)
+
+    def unsubscribe(self, view):
+        if view in self.views:
+            self.views.remove(view)
+        if not self.views:
+            scheduler.remove(self)
+
+    def tick(self):
+        start = time.perf_counter()
+        if self.blocking:
+            if self.polling:
+                # Still waiting on the last one (first views subscribing
+                # together, or a slow pacman); its result goes to everyone.
+                return
+            self.polling = True
+            future = asyncio.get_event_loop().run_in_executor(None, self.poll)
+            future.add_done_callback(lambda f: self._polled(f, start))
+            return
+        try:
+            value = self.poll()
+        except Exception:
+            logger.exception("source %s failed to poll", self.name)
+            return
+        scheduler.record(self, time.perf_counter() - start)
+        self.publish(value)
+
+    def _polled(self, future, start):
+        self.polling = False
+        scheduler.record(self, time.perf_counter() - start)
+        try:
+            value = future.result()
+        except Exception:
+            logger.exception("source %s failed to poll", self.name)
+            return
+        self.publish(value)
+
+    def publish(self, value):
+        self.value = value
+        for view in self.views:
+            view.refresh(value)
+
+
+def shared(name, poll, update_interval, blocking=False):
+    """Returns the process-wide source called name, creating it on first use."""
+    if name not in _sources:
+        _sources[name] = Source(name, poll, update_interval, blocking)
+    return _sources[name]
+
+
+class EventSource(Source):
+    """A source fed by an async stream of values instead of the scheduler.
+
+    stream.changes() is an async generator; only values that differ from the
+    last one are published, so duplicate events never reach the bar.
+    """
+
+    def __init__(self, name, stream):
+        Source.__init__(self, name, None, None)
+        self.stream = stream
+        self.task = None
+
+    def subscribe(self, view):
+        self.views.append(view)
+        if self.value is not None:
+            view.refresh(self.value)
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.follow())
+
+    def unsubscribe(self, view):
+        if view in self.views:
+            self.views.remove(view)
+        if not self.views and self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def follow(self):
+        async for value in self.stream.changes():
+            if value != self.value:
+                self.publish(value)
+
+
+class View(base._TextBox):
+    """A text widget that renders the value of a shared Source."""
+
+    orientations = base.ORIENTATION_HORIZONTAL
+    defaults = [
+        ("source", None, "Shared source to render"),
+        ("render", str, "Function turning the source value into text"),
+    ]
+
+    def __init__(self, **config):
+        base._TextBox.__init__(self, "", **config)
+        self.add_defaults(View.defaults)
+
+    def timer_setup(self):
+        self.source.subscribe(self)
+
+    def refresh(self, value):
+        damage.update(self, self.render(value))
+
+    def finalize(self):
+        if self.source is not None:
+            self.source.unsubscribe(self)
+        damage.widgets.pop(self, None)
+        base._TextBox.finalize(self)
+
+
+##### POLL FUNCTIONS #####
+
+class SystemSampler:
+    """Reads /proc/meminfo and the thermal zones for every metric at once.
+
+    Each file is opened once and re-read with preadv into a buffer that is
+    allocated once, and only the meminfo fields that are asked for are
+    parsed out of it.  A call returns one flat snapshot, e.g.
+    {"MemTotal": ..., "MemAvailable": ..., "thermal_zone0": 45.0}, and also
+    appends it to `history`, a ring buffer of the last samples, so a widget
+    that wants past values (a sparkline) costs no extra reads.
+    """
+
+    def __init__(self, fields=("MemTotal", "MemAvailable"), history=120):
+        self.fields = [(name, name.encode() + b":") for name in fields]
+        self.zones = []
+        self.files = {}
+        self.history = collections.deque(maxlen=history)
+
+    def add_zone(self, zone):
+        if zone not in self.zones:
+            self.zones.append(zone)
+
+    def read(self, path):
+        """Returns (buffer, length) holding the current contents of path."""
+        entry = self.files.get(path)
+        if entry is None:
+            entry = self.files[path] = [os.open(path, os.O_RDONLY), bytearray(4096)]
+        fd, buf = entry
+        n = os.preadv(fd, [buf], 0)
+        while n == len(buf):
+            # Didn't fit; grow the buffer for good and read again.
+            buf = entry[1] = bytearray(len(buf) * 2)
+            n = os.preadv(fd, [buf], 0)
+        return buf, n
+
+    def close(self):
+        for fd, _ in self.files.values():
+            os.close(fd)
+        self.files.clear()
+
+    def __call__(self):
+        snapshot = {}
+        buf, n = self.read("/proc/meminfo")
+        for name, label in self.fields:
+            start = buf.find(label, 0, n)
+            if start < 0:
+                continue
+            start += len(label)
+            end = buf.find(b"kB", start, n)
+            snapshot[name] = int(buf[start:end]) * 1024
+        for zone in self.zones:
+            # A missing zone (VMs, some desktops) leaves its field out rather
+            # than failing the memory reading along with it.
+            try:
+                buf, n = self.read("/sys/class/thermal/{}/temp".format(zone))
+            except OSError:
+                continue
+            snapshot[zone] = int(buf[:n]) / 1000
+        self.history.append(snapshot)
+        return snapshot
+
+
+def read_df(partition):
+    statvfs = os.statvfs(partition)
+    return (statvfs.f_frsize * statvfs.f_blocks,
+            statvfs.f_frsize * statvfs.f_bfree,
+            statvfs.f_frsize * statvfs.f_bavail)
+
+
+REMOTE_FILESYSTEMS = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs",
+                      "sshfs", "9p", "afs", "ceph", "glusterfs", "davfs"}
+
+
+def remote_mounts():
+    mounts = set()
+    with open("/proc/mounts") as f:
+        for line in f:
+            fields = line.split()
+            if fields[2] in REMOTE_FILESYSTEMS:
+                mounts.add(fields[1].replace("\\040", " "))
+    return mounts
+
+
+def mount_of(path, mounts):
+    while path not in mounts and path != "/":
+        path = os.path.dirname(path)
+    return path
+
+
+class DiskSampler:
+    """statvfs() for every watched partition in one batch.
+
+    Each partition is stat'ed in parallel on a small private pool and the
+    whole batch waits at most timeout seconds.  A partition that doesn't
+    answer in time (a hung NFS server) keeps its last value and isn't asked
+    again until its stuck call returns, so it can never pile up threads or
+    hold up the other partitions.  Remote mounts are skipped entirely unless
+    skip_remote is False.  Results are reused for ttl seconds, which has to
+    stay well under the polling interval: with the two equal, clock jitter
+    lands half the polls inside the TTL and the value goes two intervals
+    without updating.
+    """
+
+    def __init__(self, ttl=30, timeout=1, skip_remote=True):
+        self.ttl = ttl
+        self.timeout = timeout
+        self.skip_remote = skip_remote
+        self.partitions = []
+        self.results = {}
+        self.stalled = set()
+        self.sampled = None
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+
+    def add(self, partition):
+        if partition not in self.partitions:
+            self.partitions.append(partition)
+            self.sampled = None
+
+    def unstall(self, partition):
+        self.stalled.discard(partition)
+
+    def __call__(self):
+        now = time.monotonic()
+        if self.sampled is not None and now - self.sampled < self.ttl:
+            return dict(self.results)
+        self.sampled = now
+
+        wanted = [p for p in self.partitions if p not in self.stalled]
+        if self.skip_remote:
+            remote = remote_mounts()
+            wanted = [p for p in wanted if mount_of(p, remote) not in remote]
+        futures = {p: self.pool.submit(read_df, p) for p in wanted}
+        concurrent.futures.wait(futures.values(), timeout=self.timeout)
+
+        for partition, future in futures.items():
+            if not future.done():
+                logger.warning("statvfs(%s) stalled, skipping it", partition)
+                self.stalled.add(partition)
+                future.add_done_callback(lambda f, p=partition: self.unstall(p))
+            elif future.exception() is None:
+                self.results[partition] = future.result()
+        return dict(self.results)
+
+
+def count_updates(cmd="pacman -Qu"):
+    try:
+        out = subprocess.check_output(cmd, shell=True, stderr=subprocess.DEVNULL)
+    except subprocess.CalledProcessError:
+        out = b""
+    return len(out.splitlines())
+
+
+class UpdateChecker:
+    """Counts pending updates, re-running pacman only when its databases change.
+
+    pacman -Qu compares the local database against the sync databases, so its
+    answer can only change when one of those is written (pacman -Sy, -Syu,
+    installs and removals).  The last count is kept under ~/.cache/qtile
+    together with the database mtimes it was computed from, which lets a
+    restart show it straight away instead of waiting for a fresh query.
+    """
+
+    def __init__(self, cmd="pacman -Qu", dbpath="/var/lib/pacman",
+                 cache_file="~/.cache/qtile/updates.json"):
+        self.cmd = cmd
+        self.dbpath = dbpath
+        self.cache_file = os.path.expanduser(cache_file)
+        self.cached = self.load()
+
+    def stamp(self):
+        paths = glob.glob(os.path.join(self.dbpath, "sync", "*.db"))
+        paths.append(os.path.join(self.dbpath, "local"))
+        return max((os.stat(path).st_mtime for path in paths if os.path.exists(path)),
+                   default=0)
+
+    def load(self):
+        try:
+            with open(self.cache_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        tmp = self.cache_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.cached, f)
+        os.replace(tmp, self.cache_file)
+
+    def __call__(self):
+        stamp = self.stamp()
+        if self.cached and self.cached["stamp"] == stamp and self.cached["cmd"] == self.cmd:
+            return self.cached["count"]
+        count = count_updates(self.cmd)
+        self.cached = {"count": count, "stamp": stamp, "cmd": self.cmd, "checked": time.time()}
+        try:
+            self.save()
+        except OSError:
+            logger.exception("could not write %s", self.cache_file)
+        return count
+
+
+class PactlVolume:
+    """Default sink volume, following one long-lived `pactl subscribe`.
+
+    Nothing is spawned while the volume sits still; the level is only read
+    again after the audio server reports a sink or server change.  If pactl
+    exits (pulseaudio/pipewire restarting) it is started again, after a delay
+    that doubles up to max_retry seconds while the server stays down and goes
+    back to retry once a subscription has lasted a minute.
+    """
+
+    level_re = re.compile(rb"(\d+)%")
+    retry = 1
+    max_retry = 60
+
+    def relevant(self, line):
+        # "on sink #N" only: "on sink-input #N" is a stream starting,
+        # stopping or retitling, which doesn't touch the sink volume.
+        return b" on sink #" in line or b" on server" in line
+
+    async def run(self, *args):
+        proc = await asyncio.create_subprocess_exec(
+            "pactl", *args, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL)
+        out, _ = await proc.communicate()
+        return out
+
+    async def read(self):
+        volume, mute = await asyncio.gather(
+            self.run("get-sink-volume", "@DEFAULT_SINK@"),
+            self.run("get-sink-mute", "@DEFAULT_SINK@"))
+        match = self.level_re.search(volume)
+        return (int(match.group(1)) if match else None, b"yes" in mute)
+
+    async def changes(self):
+        delay = self.retry
+        while True:
+            yield await self.read()
+            started = time.monotonic()
+            proc = await asyncio.create_subprocess_exec(
+                "pactl", "subscribe", stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL)
+            try:
+                async for line in proc.stdout:
+                    if self.relevant(line):
+                        yield await self.read()
+            finally:
+                # Also reached when the last volume view goes away.
+                if proc.returncode is None:
+                    proc.kill()
+            await proc.wait()
+            if time.monotonic() - started >= 60:
+                delay = self.retry
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_retry)
+
+
+class StandInVolume:
+    """Volume events fed by hand, for tests and machines without pactl."""
+
+    def __init__(self, level=0, muted=False):
+        self.queue = asyncio.Queue()
+        self.set(level, muted)
+
+    def set(self, level, muted=False):
+        self.queue.put_nowait((level, muted))
+
+    async def changes(self):
+        while True:
+            yield await self.queue.get()
+
+
+##### RENDER FUNCTIONS #####
+
+def temp_text(threshold, foreground_alert="ff0000", zone="thermal_zone0"):
+    def render(snapshot):
+        temp = snapshot.get(zone)
+        if temp is None:
+            return "?°C"
+        text = "{:.1f}°C".format(temp)
+        if temp > threshold:
+            return '<span foreground="#{}">{}</span>'.format(foreground_alert, text)
+        return text
+    return render
+
+
+def memory_text(info):
+    used = info["MemTotal"] - info["MemAvailable"]
+    return "{: .0f}M/{: .0f}M".format(used / 1024 ** 2, info["MemTotal"] / 1024 ** 2)
+
+
+def df_text(partition):
+    def render(results):
+        if partition not in results:
+            return partition + " (?)"
+        size, free, user_free = (v // 1024 ** 3 for v in results[partition])
+        return "{} ({}G|{:.0f}%)".format(
+            partition, user_free, (size - user_free) / size * 100)
+    return render
+
+
+def clock_text(format):
+    def render(now):
+        return time.strftime(format, now)
+    return render
+
+
+def volume_text(value):
+    level, muted = value
+    if muted:
+        return "M"
+    if level is None:
+        return "?"
+    return "{}%".format(level)
+
+
+def updates_text(no_update_string="No Updates"):
+    def render(count):
+        if count == 0:
+            return no_update_string
+        return "Updates: {}".format(count)
+    return render
+
+
+##### SHARED SOURCES #####
+
+system = SystemSampler()
+
+
+def thermal(zone="thermal_zone0"):
+    # Thermal zones and memory come from the same sampler, and so the same
+    # snapshot; temp_text and memory_text pick their fields out of it.
+    system.add_zone(zone)
+    return shared("system", system, 1)
+
+
+def clock():
+    return shared("clock", time.localtime, 60)
+
+
+def memory():
+    return shared("system", system, 1)
+
+
+disks = DiskSampler()
+
+
+def df(partition="/"):
+    # Every partition shares one source; adding one costs a statvfs in the
+    # existing batch, not another poller.  The sampler's TTL (30s) only
+    # absorbs back-to-back calls, every 60s poll reads fresh values.
+    disks.add(partition)
+    return shared("df", disks, 60, blocking=True)
+
+
+def updates(cmd="pacman -Qu"):
+    # Checking the database mtimes is a handful of stat calls, so this can poll
+    # often; pacman itself only runs when they moved.
+    if "updates" not in _sources:
+        checker = UpdateChecker(cmd)
+        source = shared("updates", checker, 60, blocking=True)
+        if checker.cached and checker.cached["cmd"] == cmd:
+            source.value = checker.cached["count"]
+    return _sources["updates"]
+
+
+def volume():
+    if "volume" not in _sources:
+        if shutil.which("pactl"):
+            stream = PactlVolume()
+        else:
+            logger.warning("pactl not found, volume widget won't follow changes")
+            stream = StandInVolume()
+        _sources["volume"] = EventSource("volume", stream)
+    return _sources["volume"]
@@ -0,0 +1,89 @@
+# Startup profiler.
+#
+# config.py calls mark() as it moves from one phase to the next (imports,
+# keys, groups, ...) and wraps finer steps, like building each screen's
+# widgets, in span().  The last phase runs on into qtile's own setup until
+# the startup hook, and once startup_complete fires the whole timeline is
+# logged and written to TRACE_FILE in Chrome's trace event format (open it
+# in chrome://tracing or ui.perfetto.dev).  Marks made after that, e.g. by
+# reload.py running config.py again, are ignored.
+#
+# Import this before anything else in config.py so its clock starts there.
+
+import contextlib
+import json
+import os
+import time
+
+from libqtile import hook
+from libqtile.log_utils import logger
+
+TRACE_FILE = os.path.expanduser("~/.cache/qtile/startup-trace.json")
+
+began = time.monotonic()
+spans = []  # (name, start, end, depth)
+_phase = None
+_depth = 0
+_done = False
+
+
+def mark(name):
+    """Ends the current phase and starts the next one."""
+    global _phase
+    if _done:
+        return
+    now = time.monotonic()
+    if _phase is not None:
+        spans.append((_phase[0], _phase[1], now, 0))
+    _phase = (name, now) if name else None
+
+
+@contextlib.contextmanager
+def span(name):
+    global _depth
+    if _done:
+        yield
+        return
+    _depth += 1
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        _depth -= 1
+        spans.append((name, start, time.monotonic(), _depth + 1))
+
+
+def report():
+    for name, start, end, depth in sorted(spans, key=lambda s: (s[1], s[3])):
+        logger.info("startup: %s%-32s %7.1fms (at +%.1fms)",
+                    "  " * depth, name, (end - start) * 1000, (start - began) * 1000)
+
+
+def save():
+    events = [{"name": name, "ph": "X", "pid": os.getpid(), "tid": 0,
+               "ts": round((start - began) * 1e6), "dur": round((end - start) * 1e6)}
+              for name, start, end, _ in spans]
+    try:
+        os.makedirs(os.path.dirname(TRACE_FILE), exist_ok=True)
+        with open(TRACE_FILE, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    except OSError:
+        logger.exception("could not write %s", TRACE_FILE)
+
+
+def on_startup():
+    mark("startup hooks")
+
+
+def on_startup_complete():
+    global _done
+    mark(None)
+    _done = True
+    logger.info("startup: %.1fms from config.py to startup_complete",
+                (time.monotonic() - began) * 1000)
+    report()
+    save()
+
+
+hook.subscribe.startup(on_startup)
+hook.subscribe.startup_complete(on_startup_complete)
@@ -0,0 +1,203 @@
+# Window switcher.
+#
+# extension.WindowList walks every window in every group and formats its
+# title each time it is opened, then waits for dmenu inside qtile's event
+# loop.  Here the window list is kept up to date from the client hooks,
+# ordered by when each window last had focus.  Each window's menu line is
+# formatted when its title or group changes, and only that one; opening the
+# switcher joins the lines (when the list changed since the last open) and
+# hands the bytes to a new dmenu, and qtile carries on while the menu is up.
+#
+# Titles (and WM classes) are also indexed by trigram, so search() can find
+# windows by prefix, substring or approximate match without scanning them
+# all.  Text typed into dmenu that isn't an item (shift+return) is looked up
+# that way.
+
+import asyncio
+import collections
+import shlex
+
+from libqtile import hook
+from libqtile.log_utils import logger
+from libqtile.scratchpad import ScratchPad
+
+
+def trigrams(text):
+    text = "  " + text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class Switcher:
+    """Indexed, most-recently-used window list behind a dmenu switcher.
+
+    dmenu_command: the menu to pipe the list through.
+    item_format: menu line for a window, from {group}, {id} and {window}.
+    """
+
+    def __init__(self, dmenu_command="dmenu -i -l 80 -p Window:",
+                 item_format="{group} {id}: {window}"):
+        if isinstance(dmenu_command, str):
+            dmenu_command = shlex.split(dmenu_command)
+        self.command = list(dmenu_command)
+        self.item_format = item_format
+        self.qtile = None
+        self.ids = {}                            # window -> short id, stable while it lives
+        self.text = {}                           # window -> indexed text
+        self.index = collections.defaultdict(set)  # trigram -> windows
+        self.mru = collections.OrderedDict()     # windows, most recently focused last
+        self.serial = 0
+        self.lines = {}                          # window -> menu line
+        self.serialized = None
+        self.items = {}
+
+    def setup(self, qtile):
+        self.qtile = qtile
+        for win in list(qtile.windows_map.values()):
+            if getattr(win, "group", None) is not None:
+                self.on_new(win)
+        hook.subscribe.client_new(self.on_new)
+        hook.subscribe.client_killed(self.on_killed)
+        hook.subscribe.client_name_updated(self.on_name)
+        hook.subscribe.client_focus(self.on_focus)
+        hook.subscribe.group_window_add(self.on_moved)
+
+    ##### INDEX #####
+
+    def indexed_text(self, win):
+        wm_class = win.get_wm_class() or ()
+        return " ".join([win.name or ""] + list(wm_class[1:]))
+
+    def add_text(self, win):
+        text = self.text[win] = self.indexed_text(win)
+        for gram in trigrams(text):
+            self.index[gram].add(win)
+
+    def drop_text(self, win):
+        for gram in trigrams(self.text.pop(win, "")):
+            windows = self.index.get(gram)
+            if windows is not None:
+                windows.discard(win)
+                if not windows:
+                    del self.index[gram]
+
+    def on_new(self, win):
+        if win in self.ids:
+            return
+        self.serial += 1
+        self.ids[win] = self.serial
+        self.mru[win] = None
+        self.mru.move_to_end(win, last=False)    # new windows start out least recent
+        self.add_text(win)
+        self.lines[win] = self.line(win)
+        self.serialized = None
+
+    def on_killed(self, win):
+        if self.ids.pop(win, None) is not None:
+            self.drop_text(win)
+            self.mru.pop(win, None)
+            self.lines.pop(win, None)
+            self.serialized = None
+
+    def on_name(self, win):
+        if win in self.ids:
+            self.drop_text(win)
+            self.add_text(win)
+            self.lines[win] = self.line(win)
+            self.serialized = None
+
+    def on_moved(self, group, win):
+        # New windows land here too, once they have their group.
+        if win in self.ids:
+            self.lines[win] = self.line(win)
+            self.serialized = None
+
+    def on_focus(self, win):
+        if win in self.mru:
+            self.mru.move_to_end(win)
+            self.serialized = None
+
+    def switchable(self, win):
+        # Not ScratchPad windows (dropdowns, parked pool terminals): switching
+        # to one would put the hidden group on screen.
+        return win.group is not None and not isinstance(win.group, ScratchPad)
+
+    def listed(self):
+        """Windows in menu order: the last focused first, the focused one last."""
+        windows = [win for win in reversed(self.mru) if self.switchable(win)]
+        if len(windows) > 1:
+            windows.append(windows.pop(0))
+        return windows
+
+    def line(self, win):
+        group = win.group
+        label = (group.label or group.name) if group is not None else ""
+        return self.item_format.format(group=label, id=self.ids[win], window=win.name)
+
+    def serialize(self):
+        """Joins the menu lines in menu order; nothing is formatted here."""
+        self.items = {}
+        for win in self.listed():
+            self.items[self.lines[win]] = win
+        self.serialized = "\n".join(self.items).encode()
+
+    ##### SEARCH #####
+
+    def search(self, query, limit=10):
+        """Windows matching query, best first.
+
+        Prefix matches come first, then substring matches, then windows that
+        share at least half of the query's trigrams; ties go to the most
+        recently focused window.  Only windows the menu would list are found.
+        """
+        query = query.lower().strip()
+        if not query:
+            return []
+        recency = {win: i for i, win in enumerate(reversed(self.mru))}
+        grams = trigrams(query)
+        if len(query) < 3:
+            # Too short for trigrams: only the padded prefix grams apply.
+            candidates = self.index.get(("  " + query)[-3:], set()) | {
+                win for win, text in self.text.items() if query in text.lower()}
+        else:
+            counts = collections.Counter()
+            for gram in grams:
+                for win in self.index.get(gram, ()):
+                    counts[win] += 1
+            candidates = {win for win, n in counts.items() if n * 2 >= len(grams)}
+
+        def rank(win):
+            text = self.text[win].lower()
+            shared = len(grams & trigrams(text))
+            return (not text.startswith(query), query not in text, -shared, recency.get(win, 0))
+
+        return sorted(filter(self.switchable, candidates), key=rank)[:limit]
+
+    ##### MENU #####
+
+    def open(self, qtile):
+        """Shows the menu; bound with lazy.function(switcher.open)."""
+        if self.serialized is None:
+            self.serialize()
+        if self.items:
+            asyncio.ensure_future(self.choose(qtile, self.serialized, self.items))
+
+    async def choose(self, qtile, data, items):
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *self.command, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE)
+        except OSError:
+            logger.exception("switcher: could not run %s", self.command[0])
+            return
+        out, _ = await proc.communicate(data)
+        choice = out.decode("utf-8", "replace").rstrip("\n")
+        if not choice:
+            return
+        win = items.get(choice)
+        if win is None:
+            found = self.search(choice, limit=1)
+            win = found[0] if found else None
+        # The window may have closed (or been parked) while the menu was open.
+        if win is None or win not in self.ids or not self.switchable(win):
+            return
+        qtile.current_screen.set_group(win.group)
+        win.group.focus(win)
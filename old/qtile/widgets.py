@@ -0,0 +1,421 @@
+# Custom bar widgets.
+#
+# Small subclasses of the stock qtile widgets that trade a little memory for
+# less work per bar redraw.
+
+import collections
+import hashlib
+import html
+import mmap
+import os
+import struct
+import time
+
+import cairocffi
+from libqtile import bar, images, pangocffi
+from libqtile import widget
+from libqtile.log_utils import logger
+from libqtile.widget import base
+
+import sources
+
+##### POWERLINE SEPARATORS #####
+
+# Rasterized separators, shared by every bar on every screen and keyed by
+# everything that affects their pixels.
+GLYPH_CACHE_SIZE = 32
+_glyphs = collections.OrderedDict()
+glyph_stats = {"hits": 0, "misses": 0}
+
+
+def hashable(colour):
+    # Colours from config.py's colors table are [top, bottom] gradient lists.
+    return tuple(colour) if isinstance(colour, list) else colour
+
+
+def glyph_cache_info():
+    return dict(glyph_stats, size=len(_glyphs), maxsize=GLYPH_CACHE_SIZE)
+
+
+class Separator(base._TextBox):
+    """A TextBox for static powerline glyphs that is painted from a cache.
+
+    The bar only has a handful of distinct (glyph, colours, size) separators,
+    so each one is laid out and rasterized once into an image surface and
+    every later redraw is a single blit.
+    """
+
+    orientations = base.ORIENTATION_HORIZONTAL
+
+    def __init__(self, text=" ", **config):
+        base._TextBox.__init__(self, text, **config)
+
+    def key(self):
+        return (self.text, hashable(self.foreground), hashable(self.background or self.bar.background),
+                self.font, self.fontsize, self.actual_padding, self.width, self.bar.height)
+
+    def rasterize(self):
+        surface = cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, self.width, self.bar.height)
+        ctx, self.drawer.ctx = self.drawer.ctx, pangocffi.patch_cairo_context(cairocffi.Context(surface))
+        try:
+            self.drawer.clear(self.background or self.bar.background)
+            self.layout.draw(
+                self.actual_padding or 0,
+                int(self.bar.height / 2.0 - self.layout.height / 2.0) + 1
+            )
+        finally:
+            self.drawer.ctx = ctx
+        return surface
+
+    def glyph(self):
+        key = self.key()
+        surface = _glyphs.get(key)
+        if surface is not None:
+            glyph_stats["hits"] += 1
+            _glyphs.move_to_end(key)
+            return surface
+        glyph_stats["misses"] += 1
+        surface = _glyphs[key] = self.rasterize()
+        if len(_glyphs) > GLYPH_CACHE_SIZE:
+            _glyphs.popitem(last=False)
+        return surface
+
+    def draw(self):
+        if not self.can_draw():
+            return
+        self.drawer.ctx.set_source_surface(self.glyph())
+        self.drawer.ctx.paint()
+        self.drawer.draw(offsetx=self.offsetx, width=self.width)
+
+
+##### IMAGES #####
+
+# Decoded and scaled images, shared by every bar and kept across restarts.
+# Keyed by the file, its mtime and everything that affects the scaled
+# pixels; in memory they are ready-to-paint surfaces, on disk raw ARGB32
+# (a 16 byte header and the pixel rows) that is mapped straight back into
+# a surface.  Set IMAGE_CACHE_DIR to None to keep them in memory only.
+IMAGE_CACHE_DIR = os.path.expanduser("~/.cache/qtile/images")
+IMAGE_HEADER = struct.Struct("<4I")  # format version, width, height, stride
+IMAGE_VERSION = 1
+_images = {}
+image_stats = {"memory": 0, "disk": 0, "decoded": 0}
+
+
+def image_cache_info():
+    return dict(image_stats, size=len(_images))
+
+
+def image_file(path, mtime, params):
+    """(prefix, file name) for a rendering: <path hash>-<mtime>-<params hash>.
+
+    The prefix covers every rendering of this version of the file, so ones
+    at other sizes can live next to each other.
+    """
+    name = hashlib.sha1(path.encode()).hexdigest()[:16]
+    detail = hashlib.sha1(repr(params).encode()).hexdigest()[:16]
+    prefix = "{}-{}".format(name, mtime)
+    return os.path.join(IMAGE_CACHE_DIR, prefix), "{}-{}.argb".format(prefix, detail)
+
+
+def read_image(filename):
+    with open(filename, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    version, width, height, stride = IMAGE_HEADER.unpack_from(mapped)
+    if version != IMAGE_VERSION or len(mapped) != IMAGE_HEADER.size + stride * height:
+        return None
+    data = memoryview(mapped)[IMAGE_HEADER.size:]
+    return cairocffi.ImageSurface.create_for_data(
+        data, cairocffi.FORMAT_ARGB32, width, height, stride)
+
+
+def write_image(prefix, filename, surface):
+    surface.flush()
+    header = IMAGE_HEADER.pack(IMAGE_VERSION, surface.get_width(),
+                               surface.get_height(), surface.get_stride())
+    directory = os.path.dirname(prefix)
+    os.makedirs(directory, exist_ok=True)
+    # Renderings of older versions of the same file are dead weight; those of
+    # this version at other sizes (bars of other heights) are not.
+    current = os.path.basename(prefix)
+    name = current.split("-")[0]
+    for old in os.listdir(directory):
+        if old.startswith(name + "-") and not old.startswith(current + "-"):
+            os.unlink(os.path.join(directory, old))
+    tmp = os.path.join(directory, filename + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(header)
+        f.write(surface.get_data())
+    os.replace(tmp, os.path.join(directory, filename))
+
+
+def cached_image(path, params, render):
+    """The surface render() makes for path and params, rendering it only once.
+
+    params must hold everything besides the file that render() depends on.
+    """
+    key = (path, os.stat(path).st_mtime_ns, params)
+    surface = _images.get(key)
+    if surface is not None:
+        image_stats["memory"] += 1
+        return surface
+    if IMAGE_CACHE_DIR:
+        prefix, filename = image_file(path, *key[1:])
+        try:
+            surface = read_image(os.path.join(os.path.dirname(prefix), filename))
+        except (OSError, ValueError, struct.error):
+            surface = None
+        if surface is not None:
+            image_stats["disk"] += 1
+            _images[key] = surface
+            return surface
+    image_stats["decoded"] += 1
+    surface = _images[key] = render()
+    if IMAGE_CACHE_DIR:
+        try:
+            write_image(prefix, filename, surface)
+        except OSError:
+            logger.exception("could not cache %s", path)
+    return surface
+
+
+def paint(source, width, height):
+    surface = cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, width, height)
+    ctx = cairocffi.Context(surface)
+    ctx.set_source(source)
+    ctx.paint()
+    return surface
+
+
+class Image(base._Widget, base.MarginMixin):
+    """widget.Image, painted from the shared image cache.
+
+    The stock widget decodes the file for every bar it is in, on every
+    restart, and scales it again on every redraw.  This one paints a
+    surface that was scaled once.  Rotation is not supported.
+    """
+
+    orientations = base.ORIENTATION_HORIZONTAL
+    defaults = [
+        ("scale", True, "Scale the image to the bar height"),
+        ("filename", None, "Image filename. Can contain '~'"),
+    ]
+
+    def __init__(self, length=bar.CALCULATED, **config):
+        base._Widget.__init__(self, length, **config)
+        self.add_defaults(Image.defaults)
+        self.add_defaults(base.MarginMixin.defaults)
+        self._variable_defaults["margin"] = 0
+        self.surface = None
+
+    def _configure(self, qtile, bar):
+        base._Widget._configure(self, qtile, bar)
+        self.surface = None
+        if not self.filename:
+            logger.warning("Image filename not set!")
+            return
+        path = os.path.realpath(os.path.expanduser(self.filename))
+        if not os.path.exists(path):
+            logger.warning("Image does not exist: %s", path)
+            return
+        height = self.bar.height - self.margin_y * 2 if self.scale else None
+        self.surface = cached_image(path, ("image", height), lambda: self.render(path, height))
+
+    def render(self, path, height):
+        img = images.Img.from_path(path)
+        if height is not None:
+            img.resize(height=height)
+        return paint(img.pattern, int(img.width), int(img.height))
+
+    def calculate_length(self):
+        if self.surface is None:
+            return 0
+        return self.surface.get_width() + self.margin_x * 2
+
+    def draw(self):
+        if self.surface is None:
+            return
+        self.drawer.clear(self.background or self.bar.background)
+        self.drawer.ctx.set_source_surface(self.surface, self.margin_x, self.margin_y)
+        self.drawer.ctx.paint()
+        self.drawer.draw(offsetx=self.offset, width=self.width)
+
+
+def png_size(path):
+    with open(path, "rb") as f:
+        header = f.read(24)
+    if header[:8] != b"\x89PNG\r\n\x1a\n":
+        raise ValueError("not a PNG: {}".format(path))
+    return struct.unpack(">II", header[16:24])
+
+
+class CurrentLayoutIcon(widget.CurrentLayoutIcon):
+    """CurrentLayoutIcon whose icons come pre-scaled from the image cache.
+
+    The stock widget keeps each icon as a pattern with a scaling matrix, so
+    cairo resamples the full size PNG on every redraw (every layout change).
+    Here each icon is rendered through the same matrix once, at the size the
+    widget shows it, and redraws paint that unscaled.
+    """
+
+    def _setup_images(self):
+        icons = {}
+        for names in self._get_layout_names():
+            # Qtile 0.22 gives (name, class name) pairs, older versions just
+            # the name.  As in the stock widget, the icon is looked up by name
+            # first, then by class name, and stored under the name.
+            if isinstance(names, str):
+                names = (names,)
+            layout_name = names[0]
+            for name in dict.fromkeys(names):
+                path = self.find_icon_file_path(name)
+                if path is not None:
+                    break
+            else:
+                logger.warning('No icon found for layout "%s"', layout_name)
+                path = self.find_icon_file_path("unknown")
+            try:
+                input_width, input_height = png_size(path)
+            except (OSError, ValueError, TypeError):
+                logger.exception('Failed to load icon for layout "%s"', layout_name)
+                self.icons_loaded = False
+                return
+            # Same sizing as the stock widget; the length has to be known
+            # before any icon can be rendered at it.
+            sp = input_height / (self.bar.height - 1)
+            width = input_width / sp
+            if width > self.length:
+                self.length = int(width) + self.actual_padding * 2
+            icons[layout_name] = (os.path.realpath(path), sp, width)
+
+        for layout_name, (path, sp, width) in icons.items():
+            params = ("layout-icon", self.length, self.bar.height, self.scale, self.actual_padding)
+            surface = cached_image(path, params, lambda: self.render(path, sp, width))
+            self.surfaces[layout_name] = cairocffi.SurfacePattern(surface)
+        self.icons_loaded = True
+
+    def render(self, path, sp, width):
+        pattern = cairocffi.SurfacePattern(cairocffi.ImageSurface.create_from_png(path))
+        scaler = cairocffi.Matrix()
+        scaler.scale(sp, sp)
+        scaler.scale(self.scale, self.scale)
+        factor = (1 - 1 / self.scale) / 2
+        scaler.translate(-width * factor, -width * factor)
+        scaler.translate(self.actual_padding * -1, 0)
+        pattern.set_matrix(scaler)
+        pattern.set_filter(cairocffi.FILTER_BEST)
+        return paint(pattern, self.length, self.bar.height)
+
+
+##### WINDOW NAME #####
+
+class WindowName(widget.WindowName):
+    """WindowName that repaints only its own span, and only as often as needed.
+
+    The stock widget repaints the whole bar whenever the new title has a
+    different text width, even though the widget stretches to fill the bar
+    and its length never depends on the title.  It also re-lays out and
+    redraws on every title change, and browsers and terminals running
+    players can change their title many times a second.  Here:
+
+    - title changes are coalesced to at most max_rate redraws a second; the
+      first change after a quiet spell is still shown at once
+    - titles are cut to what can be visible in the widget before comparing,
+      so changes past the visible end don't redraw anything
+    - text layouts of recently shown titles are kept in an LRU, so flipping
+      between windows doesn't lay their titles out again
+    """
+
+    defaults = [
+        ("max_rate", 10, "Most redraws per second; faster title changes are coalesced"),
+        ("layout_cache_size", 16, "Text layouts kept for recently shown titles"),
+    ]
+
+    def __init__(self, **config):
+        widget.WindowName.__init__(self, **config)
+        self.add_defaults(WindowName.defaults)
+        self.layouts = collections.OrderedDict()
+        self.pending = None
+        self.handle = None
+        self.last_draw = 0
+        self.visible = (None, 0)
+        self.stats = {"events": 0, "redraws": 0, "unchanged": 0, "layouts_reused": 0}
+
+    def _configure(self, qtile, bar):
+        widget.WindowName._configure(self, qtile, bar)
+        self.layouts[self.layout_key(self.text)] = self.layout
+
+    def layout_key(self, text):
+        return (text, hashable(self.foreground), self.font, self.fontsize, hashable(self.fontshadow))
+
+    def visible_chars(self):
+        """How many characters could show, assuming none is narrower than "i"."""
+        key = (self.width, self.font, self.fontsize)
+        if self.visible[0] != key:
+            probe = self.drawer.textlayout("i" * 32, self.foreground, self.font,
+                                           self.fontsize, None)
+            narrowest = max(probe.width / 32, 1)
+            probe.finalize()
+            self.visible = (key, int((self.width - self.actual_padding * 2) / narrowest) + 1)
+        return self.visible[1]
+
+    def visible_text(self, text):
+        raw = html.unescape(text)
+        limit = self.visible_chars()
+        if len(raw) <= limit:
+            return text
+        return pangocffi.markup_escape_text(raw[:limit])
+
+    def update(self, text):
+        self.stats["events"] += 1
+        self.pending = text
+        if self.handle is None:
+            delay = self.last_draw + 1 / self.max_rate - time.monotonic()
+            if delay <= 0:
+                self.flush()
+            else:
+                self.handle = self.qtile.call_later(delay, self.flush)
+
+    def flush(self):
+        self.handle = None
+        text = self.visible_text(self.pending or "")
+        if text == self.text:
+            self.stats["unchanged"] += 1
+            return
+        self.show(text)
+        self.last_draw = time.monotonic()
+        self.stats["redraws"] += 1
+        sources.damage.add(self)
+
+    def show(self, text):
+        key = self.layout_key(text)
+        layout = self.layouts.pop(key, None)
+        if layout is None:
+            layout = self.drawer.textlayout(self.fmt.format(text), self.foreground, self.font,
+                                            self.fontsize, self.fontshadow, markup=self.markup)
+        else:
+            self.stats["layouts_reused"] += 1
+        self.layouts[key] = layout
+        while len(self.layouts) > self.layout_cache_size:
+            _, old = self.layouts.popitem(last=False)
+            if old is not self.layout:
+                old.finalize()
+        self._text = text
+        self.layout = layout
+
+    def finalize(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        sources.damage.widgets.pop(self, None)
+        # The base class finalizes self.layout; the cached ones are ours.
+        for layout in self.layouts.values():
+            if layout is not self.layout:
+                layout.finalize()
+        self.layouts.clear()
+        widget.WindowName.finalize(self)
+
+    def info(self):
+        info = widget.WindowName.info(self)
+        info["stats"] = dict(self.stats)
+        return info